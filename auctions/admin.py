@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Listing, Comment, Bid, Category, Watchlist
+from .models import User, Listing, Comment, Bid, Category, Watchlist, ArchivedListing, CategoryStats
 
 # Register your models here.
 admin.site.register(User)
@@ -8,3 +8,5 @@ admin.site.register(Comment)
 admin.site.register(Bid)
 admin.site.register(Category)
 admin.site.register(Watchlist)
+admin.site.register(ArchivedListing)
+admin.site.register(CategoryStats)
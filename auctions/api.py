@@ -0,0 +1,161 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from .models import Listing, Watchlist
+from .pagination import PAGE_SIZE, get_cursor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Read-only JSON API for the mobile client. Listings are read with values(), only
+# the requested fields are selected, and the watch status of a whole batch is
+# one more query, so a response costs the same number of queries for 1 or 100 listings.
+
+# most ids a batch request may ask for
+MAX_IDS = 100
+
+# field name -> lookup it is read from, or a tuple of lookups of which the first non-null value is used
+FIELDS = {
+    "id": "id",
+    "title": "title",
+    "description": "description",
+    "image": "image",
+    "category": "category__name",
+    "seller": "user__username",
+    "starting_bid": "value",
+    # the highest bid, or the starting bid while there are no bids
+    "price": ("current_price", "value"),
+    "current_price": "current_price",
+    "bid_count": "bid_count",
+    "high_bidder": "high_bidder__username",
+    "winner": "winner__username",
+    "active": "active",
+    "created": "created",
+    "ends_at": "ends_at",
+    "closed_at": "closed_at",
+    # not a column, looked up for the whole batch at once
+    "watching": None,
+}
+
+DEFAULT_FIELDS = ["id", "title", "image", "category", "price", "bid_count", "active", "ends_at", "watching"]
+
+
+class BadRequest(Exception):
+    pass
+
+
+_encoder = DjangoJSONEncoder()
+
+
+# orjson when it is installed. Decimals and datetimes go through DjangoJSONEncoder
+# on both paths, so prices are strings and times look the same (milliseconds, Z
+# for UTC) whichever library wrote them
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), status=status, content_type="application/json")
+
+
+def get_fields(request):
+    if "fields" not in request.GET:
+        return DEFAULT_FIELDS
+    # in the given order, without repeats
+    fields = list(dict.fromkeys(field for field in request.GET["fields"].split(",") if field))
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def get_ids(request):
+    try:
+        ids = [int(id) for id in request.GET["ids"].split(",") if id]
+    except ValueError:
+        raise BadRequest("ids must be a comma separated list of listing ids")
+    if len(ids) > MAX_IDS:
+        raise BadRequest(f"At most {MAX_IDS} ids per request")
+    return ids
+
+
+# the listings of the queryset as dicts holding the requested fields
+def serialize_listings(queryset, fields, user):
+    # the id is always read, the watch status and the cursor need it
+    lookups = {"id"}
+    for field in fields:
+        lookup = FIELDS[field]
+        if isinstance(lookup, str):
+            lookups.add(lookup)
+        elif lookup is not None:
+            lookups.update(lookup)
+    rows = list(queryset.values(*lookups))
+
+    watched = set()
+    if "watching" in fields and user.is_authenticated and rows:
+        watched = set(Watchlist.objects.filter(user=user.id, listing__in=[row["id"] for row in rows]).values_list("listing_id", flat=True))
+
+    listings = []
+    for row in rows:
+        listing = {}
+        for field in fields:
+            lookup = FIELDS[field]
+            if lookup is None:
+                listing[field] = row["id"] in watched
+            elif isinstance(lookup, str):
+                listing[field] = row[lookup]
+            else:
+                listing[field] = next((row[name] for name in lookup if row[name] is not None), None)
+        listings.append((row["id"], listing))
+    return listings
+
+
+# GET api/listings?ids=1,2,3 returns those listings (in that order, unknown ids are left out).
+# without ids it pages through the active listings newest first, like the index page,
+# optionally in one ?category= and continuing ?after= the last id of the previous page
+@require_GET
+def listings(request):
+    try:
+        fields = get_fields(request)
+        if "ids" in request.GET:
+            ids = get_ids(request)
+            by_id = dict(serialize_listings(Listing.objects.filter(pk__in=ids), fields, request.user))
+            return json_response({"listings": [by_id[id] for id in ids if id in by_id]})
+    except BadRequest as e:
+        return json_response({"error": str(e)}, status=400)
+
+    queryset = Listing.objects.filter(active=True)
+    category_id = get_cursor(request, "category")
+    if category_id:
+        queryset = queryset.filter(category_id=category_id)
+    after = get_cursor(request)
+    if after is not None:
+        queryset = queryset.filter(id__lt=after)
+    # fetch one extra row to find out if there is a next page
+    page = serialize_listings(queryset.order_by("-id")[:PAGE_SIZE + 1], fields, request.user)
+    next_cursor = page[PAGE_SIZE - 1][0] if len(page) > PAGE_SIZE else None
+    return json_response({
+        "listings": [listing for _, listing in page[:PAGE_SIZE]],
+        "next": next_cursor
+    })
+
+
+# GET api/listings/<id>
+@require_GET
+def listing(request, listing_id):
+    try:
+        fields = get_fields(request)
+    except BadRequest as e:
+        return json_response({"error": str(e)}, status=400)
+    found = serialize_listings(Listing.objects.filter(pk=listing_id), fields, request.user)
+    if not found:
+        return json_response({"error": f"Listing {listing_id} does not exist"}, status=404)
+    return json_response(found[0][1])
@@ -0,0 +1,97 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render
+from . import views
+from .caching import aget_category, render_listing_cards
+from .forms import NewCommentForm, NewBidForm
+from .models import Category, Listing, Watchlist
+from .pagination import COMMENTS_PAGE_SIZE, aactive_listing_count, akeyset_page, get_cursor
+
+
+# Async versions of the read-heavy views, used instead of the ones in views.py when
+# AUCTIONS_ASYNC_VIEWS is on. They run on the ASGI event loop with Django's async
+# ORM instead of a thread pool. Everything a template reads is loaded up front,
+# since templates render synchronously and may not run queries.
+
+
+# resolve the logged in user before rendering, the auth context processor reads request.user
+async def _load_user(request):
+    request.user = await request.auser()
+    return request.user
+
+
+async def index(request, category_id=None):
+    listings = Listing.objects.filter(active=True)
+    if category_id:
+        # load listings by category
+        listings = listings.filter(category_id=category_id)
+        category = (await aget_category(category_id)).name
+    else:
+        # load all active listings (default view)
+        category = 'All'
+
+    # only one page of listings is loaded, the total comes from a cached count
+    cursor = get_cursor(request)
+    page, next_cursor = await akeyset_page(listings, after=cursor)
+    await _load_user(request)
+    return render(request, "auctions/index.html", {
+        "category": category,
+        "listings": page,
+        "cards": render_listing_cards(page),
+        "total": await aactive_listing_count(listings, category_id),
+        "next_cursor": next_cursor,
+        "is_first_page": cursor is None
+    })
+
+
+async def categories(request):
+    # load all categories with their live stats, one query
+    categories = [category async for category in Category.objects.select_related("stats").order_by("id")]
+    await _load_user(request)
+    return render(request, "auctions/categories.html", {
+        "categories": categories
+    })
+
+
+async def listing(request, listing_id):
+    # bids and comments are posted to the sync view
+    if request.method == "POST":
+        return await sync_to_async(views.listing)(request, listing_id)
+
+    # load listing by id with everything the template shows, and the newest page of comments
+    try:
+        listing = await Listing.objects.select_related("user", "category", "winner").aget(pk=listing_id)
+    except Listing.DoesNotExist:
+        return await sync_to_async(views.archived_listing)(request, listing_id)
+    comments, comments_cursor = await akeyset_page(listing.listing_comments.select_related("user"), size=COMMENTS_PAGE_SIZE)
+    user = await _load_user(request)
+    # check if user is watching the listing
+    watching = await Watchlist.objects.filter(user=user.id, listing=listing_id).aexists()
+
+    return render(request, "auctions/listing.html", {
+        "listing": listing,
+        "comments": comments,
+        "comments_cursor": comments_cursor,
+        "watching": watching,
+        "commentForm": NewCommentForm(),
+        "bidForm": NewBidForm(),
+        "highest_bid": listing.current_price,
+        "live_events": views.live_events(request)
+    })
+
+
+@login_required(login_url='/login')
+async def watchlist(request):
+    user = await _load_user(request)
+    # load one page of watchlist items together with their listings, most recently watched first
+    watchlist = Watchlist.objects.filter(user=user).select_related("listing")
+    cursor = get_cursor(request)
+    page, next_cursor = await akeyset_page(watchlist, after=cursor)
+    listings = [item.listing for item in page]
+    return render(request, "auctions/watchlist.html", {
+        "cards": render_listing_cards(listings),
+        # listing ids the user is the highest bidder on
+        "winning": {listing.id for listing in listings if listing.high_bidder_id == user.id},
+        "next_cursor": next_cursor,
+        "is_first_page": cursor is None
+    })
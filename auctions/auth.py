@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from .models import User
+
+
+# the user fields requests need: the templates and views use id and username,
+# password is needed to verify the session (get_session_auth_hash) and the flags
+# for login and staff checks. anything else is loaded on first access
+USER_FIELDS = ("id", "username", "password", "is_active", "is_staff", "is_superuser")
+
+
+def _user_key(user_id):
+    return f"user:{user_id}"
+
+
+# drop a user's cached copy, called whenever the user is saved (password change,
+# deactivation, last_login), deleted or logs out
+def invalidate_user(user_id):
+    cache.delete(_user_key(user_id))
+
+
+# ModelBackend that loads the logged in user of every request from the cache
+# instead of the database, the session hash is still checked against the cached
+# password so a password change logs out the other sessions as before. With more
+# than one worker the cache must be shared (e.g. redis or memcached), otherwise a
+# worker may serve a stale copy for up to AUCTIONS_USER_CACHE_SECONDS.
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = _user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = User._default_manager.only(*USER_FIELDS).filter(pk=user_id).first()
+            if user is None:
+                return None
+            cache.set(key, user, settings.AUCTIONS_USER_CACHE_SECONDS)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,144 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.dispatch import Signal
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from .models import Category
+
+
+# Categories are set up by developers and almost never change, so they are read
+# from the cache. Every cached copy is stored under a version number, bumping the
+# version (on any Category save or delete) makes all workers reload it.
+CATEGORY_VERSION_KEY = "categories:version"
+
+
+def _categories_key():
+    # start from the current time so a version lost from the cache never comes back to an old copy
+    version = cache.get_or_set(CATEGORY_VERSION_KEY, time.time_ns, None)
+    return f"categories:v{version}"
+
+
+# all categories, in the order the database returns them
+def get_categories():
+    key = _categories_key()
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.order_by("id"))
+        cache.set(key, categories, None)
+    return categories
+
+
+async def aget_categories():
+    version = await cache.aget_or_set(CATEGORY_VERSION_KEY, time.time_ns, None)
+    key = f"categories:v{version}"
+    categories = await cache.aget(key)
+    if categories is None:
+        categories = [category async for category in Category.objects.order_by("id")]
+        await cache.aset(key, categories, None)
+    return categories
+
+
+# a single category by id, raises Category.DoesNotExist like Category.objects.get
+def get_category(category_id):
+    for category in get_categories():
+        if category.id == category_id:
+            return category
+    raise Category.DoesNotExist(f"Category {category_id} does not exist")
+
+
+async def aget_category(category_id):
+    for category in await aget_categories():
+        if category.id == category_id:
+            return category
+    raise Category.DoesNotExist(f"Category {category_id} does not exist")
+
+
+def invalidate_categories():
+    try:
+        cache.incr(CATEGORY_VERSION_KEY)
+    except ValueError:
+        # no version stored yet, the next read starts a new one
+        pass
+
+
+# Listing cards (the listing summary shown on the index, search and watchlist
+# pages) only change when the listing is bid on, commented on, closed or edited.
+# Their rendered HTML is cached under a per-listing version that those events
+# bump, together with the bid count, price and state of the row the card is
+# rendered from. The rows are read before the versions, so a bid committed in
+# between would otherwise store the card of the old row under the new version.
+CARD_TIMEOUT = 60 * 60 * 24
+
+# sent after every batch of cards with the number of cache hits and misses
+card_cache_used = Signal()
+
+
+# running totals of the card cache, connected to card_cache_used
+class CardCacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, sender, hits, misses, **kwargs):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+card_cache_stats = CardCacheStats()
+card_cache_used.connect(card_cache_stats.record)
+
+
+def card_version_key(listing_id):
+    return f"card:version:{listing_id}"
+
+
+def _card_key(listing, version):
+    return f"card:{listing.id}:v{version}:{listing.bid_count}:{int(listing.active)}:{listing.current_price}"
+
+
+# render the card of every listing, returns (listing, html) pairs in the same order.
+# two cache round trips for the whole page: one for the versions, one for the cards
+def render_listing_cards(listings):
+    version_keys = {listing.id: card_version_key(listing.id) for listing in listings}
+    versions = cache.get_many(version_keys.values())
+    # listings without a version start a new one (from the current time, like the categories)
+    new_versions = {key: time.time_ns() for key in version_keys.values() if key not in versions}
+    if new_versions:
+        cache.set_many(new_versions, None)
+        versions.update(new_versions)
+
+    card_keys = {listing.id: _card_key(listing, versions[version_keys[listing.id]]) for listing in listings}
+    cards = cache.get_many(card_keys.values())
+    hits = len(cards)
+
+    rendered = {}
+    for listing in listings:
+        key = card_keys[listing.id]
+        if key not in cards:
+            cards[key] = rendered[key] = render_to_string("auctions/listing_card.html", {"listing": listing})
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+
+    card_cache_used.send(sender=render_listing_cards, hits=hits, misses=len(rendered))
+    return [(listing, mark_safe(cards[card_keys[listing.id]])) for listing in listings]
+
+
+# the listing changed, its card has to be rendered again
+def invalidate_listing_card(listing_id):
+    try:
+        cache.incr(card_version_key(listing_id))
+    except ValueError:
+        # no version stored, the card will be rendered under a new one anyway
+        pass
@@ -0,0 +1,22 @@
+from django.conf import settings
+
+
+# run the AUCTIONS_SQLITE_PRAGMAS on a new SQLite connection, called from connection_created.
+# journal_mode=WAL is stored in the database file, the others only last for the connection
+def apply_sqlite_pragmas(connection):
+    pragmas = settings.AUCTIONS_SQLITE_PRAGMAS
+    if connection.vendor != "sqlite" or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+# the current value of each configured PRAGMA, to check a connection
+def sqlite_pragmas(connection):
+    with connection.cursor() as cursor:
+        values = {}
+        for name in settings.AUCTIONS_SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {name}")
+            values[name] = cursor.fetchone()[0]
+    return values
@@ -0,0 +1,138 @@
+import csv
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import Listing, Bid, Watchlist
+
+
+# rows fetched from the database at a time, memory is bounded by this whatever the size of the export
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+
+# what can be exported: the columns (header, lookup) and the lookups the filters apply to.
+# rows are read with values_list, so no model instances are built
+EXPORTS = {
+    "listings": {
+        "queryset": lambda: Listing.objects.all(),
+        "columns": [
+            ("id", "id"),
+            ("title", "title"),
+            ("description", "description"),
+            ("category", "category__name"),
+            ("seller", "user__username"),
+            ("starting_bid", "value"),
+            ("current_price", "current_price"),
+            ("bid_count", "bid_count"),
+            ("high_bidder", "high_bidder__username"),
+            ("winner", "winner__username"),
+            ("active", "active"),
+            ("created", "created"),
+            ("ends_at", "ends_at"),
+            ("closed_at", "closed_at"),
+        ],
+        "date": "created",
+        "category": "category_id",
+        "active": "active",
+    },
+    "bids": {
+        "queryset": lambda: Bid.objects.all(),
+        "columns": [
+            ("id", "id"),
+            ("listing_id", "listing_id"),
+            ("listing", "listing__title"),
+            ("bidder", "user__username"),
+            ("value", "value"),
+            ("created", "created"),
+        ],
+        "date": "created",
+        "category": "listing__category_id",
+        "active": "listing__active",
+    },
+    # watchlist rows have no date of their own, they are filtered by the listing's
+    "watchlists": {
+        "queryset": lambda: Watchlist.objects.all(),
+        "columns": [
+            ("id", "id"),
+            ("user", "user__username"),
+            ("listing_id", "listing_id"),
+            ("listing", "listing__title"),
+            ("listing_active", "listing__active"),
+        ],
+        "date": "listing__created",
+        "category": "listing__category_id",
+        "active": "listing__active",
+    },
+}
+
+
+# turn since/until/category/active strings (from a query string or the command line)
+# into filters, raises ValueError for values that do not parse
+def parse_filters(since=None, until=None, category=None, active=None):
+    filters = {}
+    if since:
+        filters["since"] = parse_moment(since)
+    if until:
+        filters["until"] = parse_moment(until, end_of_day=True)
+    if category:
+        filters["category"] = int(category)
+    if active:
+        if active not in ("true", "false"):
+            raise ValueError(f"active must be true or false, not {active!r}")
+        filters["active"] = active == "true"
+    return filters
+
+
+# an ISO date or datetime, a date alone means the start (or the end) of that day
+def parse_moment(value, end_of_day=False):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"{value!r} is not a date")
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def export_queryset(kind, filters):
+    export = EXPORTS[kind]
+    queryset = export["queryset"]()
+    if "since" in filters:
+        queryset = queryset.filter(**{f"{export['date']}__gte": filters["since"]})
+    if "until" in filters:
+        queryset = queryset.filter(**{f"{export['date']}__lte": filters["until"]})
+    if "category" in filters:
+        queryset = queryset.filter(**{export["category"]: filters["category"]})
+    if "active" in filters:
+        queryset = queryset.filter(**{export["active"]: filters["active"]})
+    return queryset.order_by("id").values_list(*[lookup for _, lookup in export["columns"]])
+
+
+# the export as a stream of text lines, a header line first for CSV
+def export_lines(kind, filters, file_format="csv"):
+    headers = [header for header, _ in EXPORTS[kind]["columns"]]
+    rows = export_queryset(kind, filters).iterator(chunk_size=CHUNK_SIZE)
+
+    if file_format == "csv":
+        # csv.writer returns whatever the file's write returns, so each row comes back as a string
+        writer = csv.writer(Echo())
+        yield writer.writerow(headers)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        encoder = DjangoJSONEncoder()
+        for row in rows:
+            yield encoder.encode(dict(zip(headers, row))) + "\n"
+
+
+class Echo:
+    def write(self, value):
+        return value
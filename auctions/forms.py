@@ -1,15 +1,58 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+from django.utils import timezone
+from .caching import get_categories, get_category
 from .models import Category, Comment
 
 
+# iterates the cached categories instead of running the field's queryset
+class CachedCategoryIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for category in get_categories():
+            yield self.choice(category)
+
+    def __len__(self):
+        return len(get_categories()) + (self.field.empty_label is not None)
+
+
+# category select that renders and validates from the category cache, so it never queries the database
+class CachedCategoryChoiceField(forms.ModelChoiceField):
+    iterator = CachedCategoryIterator
+
+    def __init__(self, **kwargs):
+        super().__init__(queryset=Category.objects.none(), **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return get_category(int(value))
+        except (TypeError, ValueError, Category.DoesNotExist):
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+
+
 # this form is used to create a new listing
 class NewListingForm(forms.Form):
     title = forms.CharField(label="Title", max_length=100, widget=forms.TextInput(attrs={'placeholder': 'Enter listing title'}))
     description = forms.CharField(label="Description", max_length=1000, widget=forms.Textarea(attrs={'placeholder': 'Describe your listing'}))
     starting_bid = forms.DecimalField(label="Starting Bid", max_digits=12, decimal_places=2, widget=forms.NumberInput(attrs={'placeholder': 'Enter starting bid'}))
     image_url = forms.URLField(label="Image URL", max_length=512, required=False, widget=forms.URLInput(attrs={'placeholder': 'Enter image URL'}))
-    # DB query to get all categories
-    category = forms.ModelChoiceField(queryset=Category.objects.all())
+    # categories come from the cache
+    category = CachedCategoryChoiceField()
+    ends_at = forms.DateTimeField(label="Ends at", required=False, widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}))
+
+    def clean_ends_at(self):
+        ends_at = self.cleaned_data["ends_at"]
+        if ends_at is not None and ends_at <= timezone.now():
+            raise ValidationError("The auction must end in the future")
+        return ends_at
 
 # this form is used to create a new comment
 class NewCommentForm(forms.Form):
@@ -0,0 +1,132 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.template.backends import django as django_backend
+
+
+# Per-request performance numbers: SQL queries and the time spent in them, template
+# render time and total time. The request being measured is kept in a context
+# variable, which follows it into sync_to_async threads, so the query recorder
+# (installed on every database connection) and the template backend below know
+# which request to add to. Outside a measured request they do nothing.
+
+current_stats = ContextVar("current_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("start", "queries", "sql_time", "render_time", "rendering", "signatures")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.rendering = False
+        # how often each distinct statement ran, repeats are the N+1 candidates
+        self.signatures = Counter()
+
+    def duplicates(self, threshold):
+        return [(sql, count) for sql, count in self.signatures.most_common() if count >= threshold]
+
+
+# IN lists of different lengths are the same query
+IN_LIST = re.compile(r"\((?:%s, )+%s\)")
+
+
+# queries are recorded with their placeholders, so the SQL is already a signature
+def query_signature(sql):
+    return IN_LIST.sub("(%s, ...)", sql)
+
+
+# a database execute wrapper, see install_query_recorder
+def record_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_time += time.perf_counter() - start
+        stats.queries += 1
+        stats.signatures[query_signature(sql)] += 1
+
+
+def install_query_recorder(connection):
+    # connection_created fires again whenever the connection reconnects
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# The Django template backend with the render time of top-level templates measured.
+# Included templates render inside their parent and are not counted twice.
+class DjangoTemplates(django_backend.DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = current_stats.get()
+        if stats is None or stats.rendering:
+            return self.template.render(context, request)
+        stats.rendering = True
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.render_time += time.perf_counter() - start
+            stats.rendering = False
+
+
+# Totals per view name since the process started. Every worker process keeps
+# its own, they are cheap enough to update on every request.
+class ViewCounters:
+    FIELDS = ("requests", "errors", "slow", "queries", "sql_ms", "render_ms", "total_ms", "max_ms")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def add(self, view_name, stats, total, status, slow):
+        with self._lock:
+            counters = self._views.get(view_name)
+            if counters is None:
+                counters = self._views[view_name] = dict.fromkeys(self.FIELDS, 0)
+            counters["requests"] += 1
+            counters["errors"] += status >= 500
+            counters["slow"] += slow
+            counters["queries"] += stats.queries
+            counters["sql_ms"] += stats.sql_time * 1000
+            counters["render_ms"] += stats.render_time * 1000
+            counters["total_ms"] += total * 1000
+            counters["max_ms"] = max(counters["max_ms"], total * 1000)
+
+    # the totals with per request averages
+    def snapshot(self):
+        with self._lock:
+            views = {name: dict(counters) for name, counters in self._views.items()}
+        for counters in views.values():
+            requests = counters["requests"]
+            for field in ("queries", "sql_ms", "render_ms", "total_ms"):
+                counters[f"avg_{field}"] = counters[field] / requests
+        return views
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_counters = ViewCounters()
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+
+# how many unread events a subscriber may queue, a slow client only needs the latest ones
+QUEUE_SIZE = 16
+
+
+# one open event stream, bound to the event loop it was opened on
+class Subscription:
+    __slots__ = ("loop", "queue")
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    # runs on the subscription's loop
+    def put(self, message):
+        if self.queue.full():
+            # drop the oldest event rather than block the publisher
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+# In-process pub/sub of listing events (new high bid, listing closed).
+# Publishing is called from the synchronous views (which run in worker threads
+# under ASGI), delivery happens on each subscriber's event loop. An idle
+# subscriber is a queue and a waiting coroutine, so a worker can hold thousands.
+class ListingHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    # must be called from a coroutine, the subscription is tied to its loop
+    def subscribe(self, listing_id):
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[listing_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, listing_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(listing_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[listing_id]
+
+    def subscriber_count(self, listing_id):
+        with self._lock:
+            return len(self._subscribers.get(listing_id, ()))
+
+    # send an event to everybody watching the listing, safe to call from any thread
+    def publish(self, listing_id, event, data):
+        # the message is encoded once and shared by all subscribers
+        message = format_event(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers.get(listing_id, ()))
+        # wake every event loop once, not once per subscriber
+        by_loop = defaultdict(list)
+        for subscription in subscribers:
+            by_loop[subscription.loop].append(subscription)
+        for loop, loop_subscribers in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, loop_subscribers, message)
+            except RuntimeError:
+                # the loop is closed, its subscribers will unsubscribe themselves
+                pass
+        return len(subscribers)
+
+
+# runs on the subscribers' loop
+def _deliver(subscribers, message):
+    for subscription in subscribers:
+        subscription.put(message)
+
+
+# a Server-Sent Events message
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+hub = ListingHub()
+
+
+def publish_bid(bid):
+    hub.publish(bid.listing_id, "bid", {
+        "price": str(bid.value),
+        "bidder": bid.user.username,
+        "bid_count": bid.listing.bid_count + 1,
+    })
+
+
+def publish_close(listing_id, winner_id):
+    hub.publish(listing_id, "close", {"winner": winner_id})
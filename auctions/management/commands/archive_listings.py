@@ -0,0 +1,44 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+from auctions.services import archive_closed_listings, is_locked
+
+
+# times a batch is tried while the write lock is held elsewhere, 0.1s apart
+LOCK_RETRIES = 50
+
+
+# moves old closed listings with their bids and comments to the archive tables,
+# a batch per transaction so live bidding is only held up for a moment. run it from cron
+class Command(BaseCommand):
+    help = "Archive closed listings older than AUCTIONS_ARCHIVE_AFTER_DAYS in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=settings.AUCTIONS_ARCHIVE_AFTER_DAYS, help="archive listings closed more than this many days ago")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        older_than = timedelta(days=options["days"])
+        total = 0
+        start = time.perf_counter()
+        attempts = 0
+        while True:
+            try:
+                archived = archive_closed_listings(options["batch_size"], older_than)
+            except OperationalError as e:
+                # a bidder holds the SQLite write lock, try again shortly
+                attempts += 1
+                if not is_locked(e) or attempts >= LOCK_RETRIES:
+                    raise
+                time.sleep(0.1)
+                continue
+            attempts = 0
+            if not archived:
+                break
+            total += archived
+            if options["verbosity"] > 1:
+                self.stdout.write(f"archived {total} listings")
+        self.stdout.write(f"archived {total} listings in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,117 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from auctions.models import User, Listing, Bid, Watchlist, ArchivedListing
+from auctions.services import archive_closed_listings
+
+
+# Times the queries behind the live pages (index, category page, active count,
+# listing with its top bids, a user's live bids, watchlist) while closed history
+# grows, once with the history left in the hot tables and once archiving it after
+# every step. Each series runs in its own process on a fresh database file.
+class Command(BaseCommand):
+    help = "Show that live-path query times stay flat as history grows when closed listings are archived"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--active", type=int, default=2000, help="active listings, constant over the run")
+        parser.add_argument("--history", type=int, nargs="+", default=[0, 10_000, 30_000, 60_000], help="closed listings at each step")
+        parser.add_argument("--bids-per-listing", type=int, default=10)
+        parser.add_argument("--repeat", type=int, default=50, help="times each query is run per step")
+        parser.add_argument("--output", help="write the results to this JSON file")
+        # internal: run one series in this process
+        parser.add_argument("--run", choices=["hot", "archived"], help="run one series in this process (used by the subprocesses)")
+
+    def handle(self, *args, **options):
+        if options["run"]:
+            self.stdout.write(json.dumps(self.run(options["run"] == "archived", options)))
+            return
+
+        results = {}
+        for series in ("hot", "archived"):
+            results[series] = self.run_series(series, options)
+
+        queries = list(results["hot"][0]["ms"])
+        self.stdout.write("median ms per query, history in the hot tables / archived")
+        self.stdout.write(f"{'closed':>8} " + " ".join(f"{name:>17}" for name in queries))
+        for hot, archived in zip(results["hot"], results["archived"]):
+            self.stdout.write(f"{hot['history']:>8} " + " ".join(f"{hot['ms'][name]:>8.3f}/{archived['ms'][name]:<8.3f}" for name in queries))
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+
+    def run_series(self, series, options):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, AUCTIONS_DB_NAME=os.path.join(directory, "db.sqlite3"))
+            arguments = [
+                "--run", series, "--active", str(options["active"]), "--bids-per-listing", str(options["bids_per_listing"]),
+                "--repeat", str(options["repeat"]), "--history", *map(str, options["history"]),
+            ]
+            run = subprocess.run([sys.executable, "manage.py", "bench_archive", *arguments], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if run.returncode != 0:
+            raise CommandError(f"the {series} series failed:\n{run.stderr}")
+        return json.loads(run.stdout.strip().splitlines()[-1])
+
+    def run(self, archive, options):
+        call_command("migrate", verbosity=0)
+        seed = {"users": 500, "bids_per_listing": options["bids_per_listing"]}
+        self.seed(options["active"], closed=0, step=0, **seed)
+        hot = Listing.objects.filter(active=True).order_by("-bid_count").first()
+        # a seeded user, bids and watchlists are spread evenly over them
+        user = User.objects.filter(username__startswith="seed_user").order_by("id").first()
+
+        steps = []
+        history = 0
+        for step, target in enumerate(options["history"], start=1):
+            if target > history:
+                self.seed(target - history, closed=1, step=step, **seed)
+                history = target
+            if archive:
+                while archive_closed_listings(1000, older_than=timedelta(0)):
+                    pass
+            connection.cursor().execute("ANALYZE")
+            steps.append({
+                "history": history,
+                "hot_listings": Listing.objects.count(),
+                "hot_bids": Bid.objects.count(),
+                "archived_listings": ArchivedListing.objects.count(),
+                "ms": self.measure(hot, user, options["repeat"]),
+            })
+        return steps
+
+    def seed(self, listings, closed, step, users, bids_per_listing):
+        call_command(
+            "seed_benchmark", users=users, listings=listings, bids=listings * bids_per_listing,
+            comments=listings, watchlists=listings, closed=closed, seed=step, stdout=StringIO(),
+        )
+
+    def measure(self, hot, user, repeat):
+        queries = {
+            "index": lambda: list(Listing.objects.filter(active=True).order_by("-id")[:25]),
+            "category": lambda: list(Listing.objects.filter(active=True, category_id=hot.category_id).order_by("-id")[:25]),
+            "active_count": lambda: Listing.objects.filter(active=True).count(),
+            "listing_bids": lambda: (Listing.objects.get(pk=hot.id), list(Bid.objects.filter(listing=hot.id).order_by("-value")[:10])),
+            "user_live_bids": lambda: list(Bid.objects.filter(user=user, listing__active=True)),
+            "watchlist": lambda: list(Watchlist.objects.filter(user=user).select_related("listing").order_by("-id")[:25]),
+        }
+        timings = {}
+        for name, query in queries.items():
+            query()
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                query()
+                times.append(time.perf_counter() - start)
+            timings[name] = statistics.median(times) * 1000
+        return timings
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from auctions.models import User, Listing
+
+
+# runs the app under uvicorn twice, once with the sync views and once with the
+# async ones (AUCTIONS_ASYNC_VIEWS=1), and loads both with the same concurrent clients
+class Command(BaseCommand):
+    help = "Compare requests/sec and p99 latency of the sync and async views under uvicorn"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=50, help="concurrent keep-alive connections")
+        parser.add_argument("--duration", type=float, default=10, help="seconds of load per mode")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--output", help="write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        if find_spec("uvicorn") is None:
+            raise CommandError("uvicorn is not installed (pip install -r dev-requirements.txt)")
+        listing = Listing.objects.filter(active=True).first()
+        if listing is None:
+            raise CommandError("No active listings, create some first (e.g. manage.py seed_benchmark)")
+
+        paths = ["/", "/categories", f"/listing/{listing.id}", "/watchlist"]
+        cookie = f"{settings.SESSION_COOKIE_NAME}={self.login_session()}"
+
+        results = {}
+        for mode in ("sync", "async"):
+            server = self.start_server(options["port"], mode == "async")
+            try:
+                results[mode] = asyncio.run(self.load(options["port"], paths, cookie, options["concurrency"], options["duration"]))
+            finally:
+                server.terminate()
+                server.wait()
+            result = results[mode]
+            self.stdout.write(
+                f"{mode:>5}: {result['requests_per_second']:.1f} req/s, p50 {result['p50_ms']:.1f} ms, "
+                f"p99 {result['p99_ms']:.1f} ms, errors {result['errors']}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+
+    # a session for a benchmark user so /watchlist is served instead of redirected
+    def login_session(self):
+        user, _ = User.objects.get_or_create(username="bench_async")
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return session.session_key
+
+    def start_server(self, port, async_views):
+        env = dict(os.environ, AUCTIONS_ASYNC_VIEWS="1" if async_views else "0")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "commerce.asgi:application", "--port", str(port), "--log-level", "warning", "--no-access-log"],
+            cwd=settings.BASE_DIR,
+            env=env,
+        )
+        # wait until it accepts connections
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                return server
+            except OSError:
+                time.sleep(0.1)
+        server.terminate()
+        raise CommandError("uvicorn did not start")
+
+    async def load(self, port, paths, cookie, concurrency, duration):
+        latencies = []
+        errors = 0
+        deadline = time.perf_counter() + duration
+
+        async def client(offset):
+            nonlocal errors
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            index = offset
+            try:
+                while time.perf_counter() < deadline:
+                    path = paths[index % len(paths)]
+                    index += 1
+                    start = time.perf_counter()
+                    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\n\r\n".encode())
+                    status = await read_response(reader)
+                    latencies.append(time.perf_counter() - start)
+                    if status != 200:
+                        errors += 1
+            finally:
+                writer.close()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "requests_per_second": len(latencies) / elapsed,
+            "p50_ms": latencies[len(latencies) // 2] * 1000,
+            "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        }
+
+
+# read one HTTP/1.1 response (Content-Length or chunked body), returns the status code
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding") == "chunked":
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    return status
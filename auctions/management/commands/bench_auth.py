@@ -0,0 +1,100 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from auctions.models import User, Listing, Watchlist
+
+
+# session engine and authentication backend of each setup
+SETUPS = {
+    "database": {
+        "SESSION_ENGINE": "django.contrib.sessions.backends.db",
+        "AUTHENTICATION_BACKENDS": ["django.contrib.auth.backends.ModelBackend"],
+    },
+    "cached": {
+        "SESSION_ENGINE": "django.contrib.sessions.backends.cached_db",
+        "AUTHENTICATION_BACKENDS": ["auctions.auth.CachedModelBackend"],
+    },
+}
+
+
+# Queries and latency of logged in requests with the session and user read from
+# the database on every request (Django's defaults) and from the cache (the
+# project settings). Runs in process with the test client against the current
+# database, normally one filled by seed_benchmark.
+class Command(BaseCommand):
+    help = "Show the queries per request saved by the cached session and user lookup"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50, help="timed requests per URL")
+        parser.add_argument("--output", help="write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        listing = Listing.objects.filter(active=True).order_by("-bid_count").first()
+        if listing is None:
+            raise CommandError("No active listings, create some first (manage.py seed_benchmark)")
+        # the user watching the most listings
+        watcher = Watchlist.objects.values("user").annotate(count=Count("id")).order_by("-count").first()
+        user = User.objects.get(pk=watcher["user"]) if watcher else listing.user
+        host = next((host.lstrip(".") for host in settings.ALLOWED_HOSTS if host != "*"), "localhost")
+
+        paths = {
+            "index": ("get", reverse("auctions:index")),
+            "categories": ("get", reverse("auctions:categories")),
+            "listing": ("get", reverse("auctions:listing", args=(listing.id,))),
+            "watchlist": ("get", reverse("auctions:watchlist")),
+            # requested an even number of times, so the watchlist ends up as it was
+            "watchlist_listing": ("post", reverse("auctions:watchlist_listing", args=(listing.id,))),
+        }
+
+        results = {}
+        for setup, overrides in SETUPS.items():
+            cache.clear()
+            with override_settings(**overrides):
+                # a new client loads the middleware with the overridden settings
+                client = Client(SERVER_NAME=host)
+                client.force_login(user)
+                results[setup] = {name: self.measure(client, method, path, options["requests"]) for name, (method, path) in paths.items()}
+
+        self.stdout.write(f"{'':>18} {'queries':>18} {'p50 ms':>18}")
+        self.stdout.write(f"{'':>18} {'database  cached':>18} {'database  cached':>18}")
+        for name in paths:
+            before, after = results["database"][name], results["cached"][name]
+            self.stdout.write(
+                f"{name:>18} {before['queries']:>8} {after['queries']:>8}  {before['p50_ms']:>8.2f} {after['p50_ms']:>8.2f}"
+            )
+        saved = statistics.mean(results["database"][name]["queries"] - results["cached"][name]["queries"] for name in paths)
+        self.stdout.write(f"{saved:.1f} queries saved per request")
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+
+    def measure(self, client, method, path, count):
+        requests = count + count % 2
+        # warm the caches
+        for _ in range(2):
+            getattr(client, method)(path)
+
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            getattr(client, method)(path)
+            latencies.append(time.perf_counter() - start)
+
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(client, method)(path)
+            getattr(client, method)(path)
+        return {
+            "status": response.status_code,
+            "queries": len(context) // 2,
+            "p50_ms": statistics.median(latencies) * 1000,
+        }
@@ -0,0 +1,158 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from auctions.models import User, Category, Listing, Bid
+
+
+# rate limits no client reaches, the benchmark posts faster than any client may
+UNLIMITED = {scope: (10**9, 1) for scope in settings.AUCTIONS_RATE_LIMITS}
+
+
+# Bid POST throughput under concurrency, once per database profile. Each profile
+# runs in its own process (settings are read at startup) on a fresh database
+# file. Every thread is a logged in bidder posting to the bid form of a few hot
+# listings, with the connection handling of a real request around each POST.
+class Command(BaseCommand):
+    help = "Compare bid POST throughput of the development and production database profiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--duration", type=float, default=10, help="seconds of load per profile")
+        parser.add_argument("--listings", type=int, default=4, help="hot listings the bids are spread over")
+        parser.add_argument("--profiles", nargs="+", default=["development", "production"])
+        parser.add_argument("--output", help="write the results to this JSON file")
+        # internal: run the load in this process with the current settings
+        parser.add_argument("--run", action="store_true", help="run the load with the current profile (used by the subprocesses)")
+
+    def handle(self, *args, **options):
+        if options["run"]:
+            # a line of JSON for the parent process
+            self.stdout.write(json.dumps(self.run(options["threads"], options["duration"], options["listings"])))
+            return
+
+        results = {}
+        for profile in options["profiles"]:
+            results[profile] = self.run_profile(profile, options)
+            result = results[profile]
+            self.stdout.write(
+                f"{profile:>12}: {result['accepted_per_second']:.1f} accepted bids/sec, {result['posts_per_second']:.1f} posts/sec, "
+                f"p99 {result['p99_ms']:.1f} ms, errors {result['errors']}"
+            )
+        if "development" in results and "production" in results and results["development"]["accepted_per_second"]:
+            gain = results["production"]["accepted_per_second"] / results["development"]["accepted_per_second"]
+            self.stdout.write(f"production / development: {gain:.2f}x accepted bids/sec")
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+
+    def run_profile(self, profile, options):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, AUCTIONS_DB_PROFILE=profile, AUCTIONS_DB_NAME=os.path.join(directory, "db.sqlite3"))
+            run = subprocess.run(
+                [sys.executable, "manage.py", "bench_bid_posts", "--run", "--threads", str(options["threads"]),
+                 "--duration", str(options["duration"]), "--listings", str(options["listings"])],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+        if run.returncode != 0:
+            raise CommandError(f"the {profile} run failed:\n{run.stderr}")
+        return json.loads(run.stdout.strip().splitlines()[-1])
+
+    def run(self, thread_count, duration, listing_count):
+        call_command("migrate", verbosity=0)
+        seller = User.objects.create(username="bench_seller")
+        category = Category.objects.create(name="Benchmark")
+        listings = [
+            Listing.objects.create(title=f"Hot listing {i}", description="Benchmark listing", value=Decimal("1.00"), user=seller, category=category).id
+            for i in range(listing_count)
+        ]
+        bidders = [User.objects.create(username=f"bench_bidder{i}") for i in range(thread_count)]
+        connection.close()
+
+        host = next((host.lstrip(".") for host in settings.ALLOWED_HOSTS if host != "*"), "localhost")
+        lock = threading.Lock()
+        prices = {listing: Decimal("1.00") for listing in listings}
+        totals = {"accepted": 0, "rejected": 0, "errors": 0}
+        latencies = []
+        barrier = threading.Barrier(thread_count)
+        deadline = None
+
+        # the next price for a listing, bidders compete for the same listings
+        def next_price(listing):
+            with lock:
+                prices[listing] += Decimal("0.01")
+                return prices[listing]
+
+        def bidder(user, offset):
+            client = Client(SERVER_NAME=host, raise_request_exception=False)
+            client.force_login(user)
+            close_old_connections()
+            counts = {"accepted": 0, "rejected": 0, "errors": 0}
+            times = []
+            barrier.wait()
+            index = offset
+            try:
+                while time.perf_counter() < deadline:
+                    listing = listings[index % len(listings)]
+                    index += 1
+                    start = time.perf_counter()
+                    # the test client leaves connection handling to us, do what the request handler does
+                    close_old_connections()
+                    try:
+                        response = client.post(reverse("auctions:listing", args=(listing,)), {"submit_bid": "", "bid": str(next_price(listing))})
+                        status = response.status_code
+                    except Exception:
+                        status = 500
+                    finally:
+                        close_old_connections()
+                    times.append(time.perf_counter() - start)
+                    if status == 302:
+                        counts["accepted"] += 1
+                    elif status == 200:
+                        # outbid or told to try again, the form is shown with the error
+                        counts["rejected"] += 1
+                    else:
+                        counts["errors"] += 1
+            finally:
+                connection.close()
+                with lock:
+                    for name, count in counts.items():
+                        totals[name] += count
+                    latencies.extend(times)
+
+        threads = [threading.Thread(target=bidder, args=(user, i)) for i, user in enumerate(bidders)]
+        start = time.perf_counter()
+        deadline = start + duration
+        with override_settings(AUCTIONS_RATE_LIMITS=UNLIMITED):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        posts = len(latencies)
+        return {
+            "profile": settings.AUCTIONS_DB_PROFILE,
+            "threads": thread_count,
+            "posts": posts,
+            **totals,
+            "stored_bids": Bid.objects.count(),
+            "posts_per_second": posts / elapsed,
+            "accepted_per_second": totals["accepted"] / elapsed,
+            "p50_ms": latencies[posts // 2] * 1000 if posts else 0,
+            "p99_ms": latencies[min(posts - 1, int(posts * 0.99))] * 1000 if posts else 0,
+        }
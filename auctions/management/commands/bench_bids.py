@@ -0,0 +1,61 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from auctions.models import User, Category, Listing, Bid
+from auctions.services import BidError, place_bid
+
+
+# hammers a single listing with concurrent bidders and reports throughput
+class Command(BaseCommand):
+    help = "Stress test bid placement on one hot listing and report bids per second"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--bids", type=int, default=100, help="bids attempted by each thread")
+
+    def handle(self, *args, **options):
+        seller, _ = User.objects.get_or_create(username="bench_seller")
+        category, _ = Category.objects.get_or_create(name="Benchmark")
+        listing = Listing.objects.create(title="Hot listing", description="Benchmark listing", value=Decimal("1.00"), user=seller, category=category)
+        bidders = [User.objects.get_or_create(username=f"bench_bidder{i}")[0] for i in range(options["threads"])]
+
+        barrier = threading.Barrier(len(bidders))
+        lock = threading.Lock()
+        totals = {"accepted": 0, "rejected": 0}
+
+        def bidder(user, offset):
+            accepted = rejected = 0
+            barrier.wait()
+            try:
+                # every bidder races for the same price points
+                for step in range(1, options["bids"] + 1):
+                    try:
+                        place_bid(listing.id, user, Decimal(step) + Decimal(offset) / 100)
+                        accepted += 1
+                    except BidError:
+                        rejected += 1
+            finally:
+                connection.close()
+                with lock:
+                    totals["accepted"] += accepted
+                    totals["rejected"] += rejected
+
+        threads = [threading.Thread(target=bidder, args=(user, i)) for i, user in enumerate(bidders)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        # every stored bid must beat the one stored before it
+        values = list(Bid.objects.filter(listing=listing).order_by("id").values_list("value", flat=True))
+        invalid = sum(1 for previous, value in zip(values, values[1:]) if value <= previous)
+        attempts = totals["accepted"] + totals["rejected"]
+
+        self.stdout.write(f"threads: {len(bidders)}, attempts: {attempts}, accepted: {totals['accepted']}, rejected: {totals['rejected']}")
+        self.stdout.write(f"invalid bids: {invalid}")
+        self.stdout.write(f"attempts/sec: {attempts / elapsed:.1f}, accepted bids/sec: {totals['accepted'] / elapsed:.1f}")
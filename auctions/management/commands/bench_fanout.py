@@ -0,0 +1,63 @@
+import asyncio
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from auctions.live import ListingHub
+
+
+# opens many idle subscribers on one listing and measures how long a published
+# event takes to reach all of them, publishing from a thread like the bid view does
+class Command(BaseCommand):
+    help = "Load test of the live listing event hub: fan-out latency to many idle subscribers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, default=5000)
+        parser.add_argument("--events", type=int, default=20)
+        parser.add_argument("--interval", type=float, default=0.05, help="seconds between published events")
+
+    def handle(self, *args, **options):
+        latencies = asyncio.run(self.run(options["subscribers"], options["events"], options["interval"]))
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(f"subscribers: {options['subscribers']}, events: {options['events']}, deliveries: {len(latencies)}")
+        self.stdout.write(
+            f"fan-out latency ms: p50 {percentile(0.50):.2f}, p99 {percentile(0.99):.2f}, "
+            f"max {latencies[-1] * 1000:.2f}, mean {statistics.mean(latencies) * 1000:.2f}"
+        )
+
+    async def run(self, subscriber_count, event_count, interval):
+        hub = ListingHub()
+        listing_id = 1
+        latencies = []
+
+        async def subscriber():
+            subscription = hub.subscribe(listing_id)
+            try:
+                for _ in range(event_count):
+                    message = await subscription.queue.get()
+                    # the publish time travels in the event data
+                    sent = float(message.split("data: ")[1])
+                    latencies.append(time.perf_counter() - sent)
+            finally:
+                hub.unsubscribe(listing_id, subscription)
+
+        tasks = [asyncio.create_task(subscriber()) for _ in range(subscriber_count)]
+        # let every subscriber reach its first await
+        while hub.subscriber_count(listing_id) < subscriber_count:
+            await asyncio.sleep(0.01)
+
+        def publisher():
+            for _ in range(event_count):
+                hub.publish(listing_id, "bid", time.perf_counter())
+                time.sleep(interval)
+
+        thread = threading.Thread(target=publisher)
+        thread.start()
+        await asyncio.gather(*tasks)
+        thread.join()
+        return latencies
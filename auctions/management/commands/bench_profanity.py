@@ -0,0 +1,42 @@
+import random
+import time
+
+from better_profanity import profanity
+from django.core.management.base import BaseCommand
+from auctions.profanity import get_matcher
+
+
+# compares the precompiled matcher with better_profanity on listing-sized descriptions
+class Command(BaseCommand):
+    help = "Microbenchmark of the profanity check on 1 KB descriptions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--texts", type=int, default=200)
+        parser.add_argument("--size", type=int, default=1000, help="length of every description")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        vocabulary = "vintage bicycle frame with original paint and new tyres, collection only. works great, some scratches on the side".split()
+        texts = []
+        for _ in range(options["texts"]):
+            text = ""
+            while len(text) < options["size"]:
+                text += rng.choice(vocabulary) + " "
+            texts.append(text[:options["size"]])
+
+        # compiling the matcher is a one-off cost, keep it out of the timings
+        start = time.perf_counter()
+        matcher = get_matcher()
+        self.stdout.write(f"compile: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        results = {}
+        for name, check in (("better_profanity", profanity.contains_profanity), ("matcher", matcher.contains_profanity)):
+            start = time.perf_counter()
+            verdicts = [check(text) for text in texts]
+            elapsed = time.perf_counter() - start
+            results[name] = verdicts
+            self.stdout.write(f"{name}: {elapsed / len(texts) * 1000:.3f} ms per description")
+
+        if results["better_profanity"] != results["matcher"]:
+            self.stderr.write("verdicts differ!")
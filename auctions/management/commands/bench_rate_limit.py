@@ -0,0 +1,89 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+from auctions import views
+from auctions.models import User, Listing
+from auctions.ratelimit import count_request
+
+
+# rate limits no client reaches, every timed request is let through
+UNLIMITED = {scope: (10**9, 1) for scope in settings.AUCTIONS_RATE_LIMITS}
+
+
+# Time the rate limiter adds to requests it lets through: count_request on its own,
+# and the watch toggle view called with and without its rate_limit wrapper
+# (requests built with RequestFactory, so the rest of the stack is left out).
+# The limits are raised so every request is allowed and the full counter
+# bookkeeping runs each time. Uses the current database, normally one filled
+# by seed_benchmark.
+class Command(BaseCommand):
+    help = "Measure the overhead of the rate limiter on allowed requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="timed calls of each kind")
+        parser.add_argument("--cache", default=settings.AUCTIONS_RATE_LIMIT_CACHE, help="cache alias holding the counters")
+        parser.add_argument("--output", help="write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        listing = Listing.objects.filter(active=True).first()
+        if listing is None:
+            raise CommandError("No active listings, create some first (manage.py seed_benchmark)")
+        user, _ = User.objects.get_or_create(username="bench_rate_limit")
+        factory = RequestFactory()
+        path = reverse("auctions:watchlist_listing", args=(listing.id,))
+
+        def request():
+            request = factory.post(path)
+            request.session = SessionStore()
+            request.session[SESSION_KEY] = str(user.pk)
+            request.user = user
+            return request
+
+        # require_POST -> rate_limit -> the view
+        limited = views.watch_listing.__wrapped__
+        plain = limited.__wrapped__
+        count = options["requests"] + options["requests"] % 2
+
+        with override_settings(AUCTIONS_RATE_LIMIT_CACHE=options["cache"], AUCTIONS_RATE_LIMITS=UNLIMITED):
+            counting = self.time(lambda request: count_request(request, "watch"), request, count)
+            # interleaved so both see the same database state, an even count leaves the watchlist as it was
+            view_plain, view_limited = [], []
+            for _ in range(count // 2):
+                view_plain.extend(self.time(lambda request: plain(request, listing.id), request, 2))
+                view_limited.extend(self.time(lambda request: limited(request, listing.id), request, 2))
+
+        results = {
+            "cache": options["cache"],
+            "backend": settings.CACHES[options["cache"]]["BACKEND"],
+            "count_request_us": statistics.median(counting) * 1e6,
+            "view_us": statistics.median(view_plain) * 1e6,
+            "view_limited_us": statistics.median(view_limited) * 1e6,
+        }
+        results["overhead_us"] = results["view_limited_us"] - results["view_us"]
+        self.stdout.write(f"cache {results['cache']} ({results['backend']})")
+        self.stdout.write(f"count_request: {results['count_request_us']:.1f} us median")
+        self.stdout.write(
+            f"watch toggle: {results['view_us']:.1f} us without the limiter, {results['view_limited_us']:.1f} us with it "
+            f"({results['overhead_us']:+.1f} us, {results['overhead_us'] / results['view_us'] * 100:+.1f}%)"
+        )
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+
+    # seconds per call, the requests are built outside the timed part
+    def time(self, call, request, count):
+        times = []
+        for _ in range(count):
+            current = request()
+            start = time.perf_counter()
+            call(current)
+            times.append(time.perf_counter() - start)
+        return times
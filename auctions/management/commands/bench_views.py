@@ -0,0 +1,204 @@
+import json
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from auctions import urls
+from auctions.models import User, Category, Listing, Bid, Comment, Watchlist
+
+
+# rate limits no client reaches, the benchmark posts faster than any client may
+UNLIMITED = {scope: (10**9, 1) for scope in settings.AUCTIONS_RATE_LIMITS}
+
+
+# routes that are not benchmarked, with the reason
+SKIPPED = {
+    "listing_events": "an event stream never ends",
+    "close_listing": "closes the listing it is given",
+}
+
+
+# Requests every route of auctions/urls.py (and the bid POST) in process with the
+# test client against the current database, normally one filled by seed_benchmark.
+# Latency is measured on its own, query counts and peak memory (tracemalloc) in a
+# second, slower pass. Results are written as JSON so runs can be compared.
+class Command(BaseCommand):
+    help = "Benchmark every view: latency percentiles, query counts and peak memory per URL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50, help="timed requests per URL")
+        parser.add_argument("--warmup", type=int, default=5, help="untimed requests per URL first")
+        parser.add_argument("--only", nargs="+", help="only these route names")
+        parser.add_argument("--output", help="write the results to this JSON file")
+        parser.add_argument("--compare", help="a previous results file to compare against")
+
+    def handle(self, *args, **options):
+        listing = Listing.objects.filter(active=True, ends_at__isnull=True).order_by("-bid_count").first()
+        if listing is None:
+            raise CommandError("No active listings, create some first (manage.py seed_benchmark)")
+        self.listing = listing
+        self.category = listing.category_id
+        # the user watching the most listings
+        watcher = Watchlist.objects.values("user").annotate(count=Count("id")).order_by("-count").first()
+        self.user = User.objects.get(pk=watcher["user"]) if watcher else listing.user
+        self.staff, _ = User.objects.get_or_create(username="bench_views", defaults={"is_staff": True})
+        # a price the benchmark bids can keep beating
+        self.price = listing.current_price or listing.value
+
+        cases = self.cases()
+        unknown = set(options["only"] or []) - {name for name, *_ in cases}
+        if unknown:
+            raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}")
+        missing = {pattern.name for pattern in urls.urlpatterns} - {name for name, *_ in cases} - set(SKIPPED)
+        for name in sorted(missing):
+            self.stderr.write(f"no benchmark for route {name}")
+        for name, reason in SKIPPED.items():
+            self.stdout.write(f"skipping {name}: {reason}")
+
+        results = {}
+        for name, method, path, data, client in cases:
+            if options["only"] and name not in options["only"]:
+                continue
+            with override_settings(AUCTIONS_RATE_LIMITS=UNLIMITED):
+                results[name] = self.measure(client, method, path, data, options["requests"], options["warmup"])
+            result = results[name]
+            self.stdout.write(
+                f"{name:>22}: p50 {result['p50_ms']:7.1f} ms, p95 {result['p95_ms']:7.1f} ms, p99 {result['p99_ms']:7.1f} ms, "
+                f"{result['queries']:3} queries, peak {result['peak_memory_kb']:8.1f} KB, status {result['status']}"
+            )
+
+        report = {
+            "created": timezone.now().isoformat(),
+            "database": {
+                "vendor": connection.vendor,
+                "users": User.objects.count(),
+                "categories": Category.objects.count(),
+                "listings": Listing.objects.count(),
+                "bids": Bid.objects.count(),
+                "comments": Comment.objects.count(),
+                "watchlists": Watchlist.objects.count(),
+            },
+            "requests": options["requests"],
+            "results": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+        if options["compare"]:
+            self.compare(options["compare"], results)
+
+    # (route name, method, path, data, client) for every route we can request repeatedly
+    def cases(self):
+        # a host the settings accept, with DEBUG on an empty ALLOWED_HOSTS allows localhost
+        host = next((host.lstrip(".") for host in settings.ALLOWED_HOSTS if host != "*"), "localhost")
+        user = Client(SERVER_NAME=host)
+        user.force_login(self.user)
+        staff = Client(SERVER_NAME=host)
+        staff.force_login(self.staff)
+        anonymous = Client(SERVER_NAME=host)
+        listing = self.listing.id
+        batch = ",".join(str(id) for id in Listing.objects.filter(active=True).order_by("-id").values_list("id", flat=True)[:50])
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+
+        return [
+            ("index", "get", reverse("auctions:index"), None, user),
+            ("index_with_category", "get", reverse("auctions:index_with_category", args=(self.category,)), None, user),
+            ("categories", "get", reverse("auctions:categories"), None, user),
+            ("search", "get", reverse("auctions:search"), {"q": "vintage camera"}, user),
+            ("listing", "get", reverse("auctions:listing", args=(listing,)), None, user),
+            ("listing (bid)", "post", reverse("auctions:listing", args=(listing,)), self.bid_data, user),
+            ("listing_comments", "get", reverse("auctions:listing_comments", args=(listing,)), None, user),
+            ("watchlist", "get", reverse("auctions:watchlist"), None, user),
+            # requested an even number of times, so the watchlist ends up as it was
+            ("watchlist_listing", "post", reverse("auctions:watchlist_listing", args=(listing,)), {}, user),
+            ("add_listing", "get", reverse("auctions:add_listing"), None, user),
+            ("api_listings", "get", reverse("auctions:api_listings"), {"ids": batch}, user),
+            ("api_listing", "get", reverse("auctions:api_listing", args=(listing,)), None, user),
+            ("export", "get", reverse("auctions:export", args=("bids",)), {"since": since}, staff),
+            ("login", "get", reverse("auctions:login"), None, anonymous),
+            ("register", "get", reverse("auctions:register"), None, anonymous),
+            ("logout", "get", reverse("auctions:logout"), None, anonymous),
+        ]
+
+    # every bid beats the previous one
+    def bid_data(self):
+        self.price += 1
+        return {"submit_bid": "", "bid": str(self.price)}
+
+    def request(self, client, method, path, data):
+        if callable(data):
+            data = data()
+        response = getattr(client, method)(path, data)
+        # read streamed bodies to the end, they are produced while being read
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def measure(self, client, method, path, data, count, warmup):
+        requests = count + count % 2
+        for _ in range(warmup + warmup % 2):
+            self.request(client, method, path, data)
+
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = self.request(client, method, path, data)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+
+        # tracing slows everything down, so queries and memory are measured separately
+        queries = peak = 0
+        tracemalloc.start()
+        try:
+            for _ in range(2):
+                tracemalloc.reset_peak()
+                with CaptureQueriesContext(connection) as context:
+                    self.request(client, method, path, data)
+                queries = max(queries, len(context))
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        return {
+            "method": method.upper(),
+            "path": path,
+            "status": response.status_code,
+            "requests": len(latencies),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": latencies[-1] * 1000,
+            "queries": queries,
+            "peak_memory_kb": peak / 1024,
+        }
+
+    def compare(self, path, results):
+        with open(path) as previous:
+            before = json.load(previous)["results"]
+        self.stdout.write(f"compared to {path}:")
+        for name, result in results.items():
+            if name not in before:
+                continue
+            old = before[name]
+            self.stdout.write(
+                f"{name:>22}: p50 {change(old['p50_ms'], result['p50_ms'])}, p99 {change(old['p99_ms'], result['p99_ms'])}, "
+                f"queries {old['queries']} -> {result['queries']}, peak memory {change(old['peak_memory_kb'], result['peak_memory_kb'])}"
+            )
+
+
+def change(old, new):
+    if not old:
+        return f"{new:.1f}"
+    return f"{(new - old) / old * 100:+.0f}%"
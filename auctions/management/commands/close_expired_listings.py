@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+from auctions.services import close_expired_listings, is_locked
+
+
+# times a batch is tried while the write lock is held elsewhere, 0.1s apart
+LOCK_RETRIES = 50
+
+
+# closes timed auctions whose ends_at has passed. run it from cron, or keep it
+# running with --loop. several copies can run at the same time
+class Command(BaseCommand):
+    help = "Close expired timed auctions in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--loop", action="store_true", help="keep running and check every --interval seconds")
+        parser.add_argument("--interval", type=float, default=5)
+
+    def handle(self, *args, **options):
+        while True:
+            closed = self.close_all(options["batch_size"])
+            if closed or options["verbosity"] > 1:
+                self.stdout.write(f"closed {closed} listings")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+            # a long running worker must not keep using a stale connection
+            close_old_connections()
+
+    # close batches until nothing has expired
+    def close_all(self, batch_size):
+        total = 0
+        attempts = 0
+        while True:
+            try:
+                closed = close_expired_listings(batch_size)
+            except OperationalError as e:
+                # another worker holds the SQLite write lock, try again shortly
+                attempts += 1
+                if not is_locked(e) or attempts >= LOCK_RETRIES:
+                    raise
+                time.sleep(0.1)
+                continue
+            attempts = 0
+            if not closed:
+                return total
+            total += closed
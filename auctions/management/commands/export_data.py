@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from auctions.exports import EXPORTS, FORMATS, export_lines, parse_filters
+
+
+# the same streamed export as the export view, written to a file or stdout
+class Command(BaseCommand):
+    help = "Export listings, bids or watchlists as CSV or JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(EXPORTS))
+        parser.add_argument("--format", choices=list(FORMATS), default="csv")
+        parser.add_argument("--output", help="file to write, defaults to stdout")
+        parser.add_argument("--since", help="ISO date or datetime")
+        parser.add_argument("--until", help="ISO date or datetime, a date includes the whole day")
+        parser.add_argument("--category", help="category id")
+        parser.add_argument("--active", choices=["true", "false"])
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_filters(options["since"], options["until"], options["category"], options["active"])
+        except ValueError as e:
+            raise CommandError(e)
+
+        lines = export_lines(options["kind"], filters, options["format"])
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as output:
+                output.writelines(lines)
+        else:
+            self.stdout.ending = ""
+            for line in lines:
+                self.stdout.write(line)
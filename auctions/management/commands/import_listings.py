@@ -0,0 +1,159 @@
+import csv
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from auctions.caching import get_categories
+from auctions.models import User, Listing
+from auctions.pagination import invalidate_listing_count
+from auctions.services import reconcile_category_stats
+
+
+# fields of an input row, user is a username and category a category name
+FIELDS = ["title", "description", "starting_bid", "image", "category", "user", "ends_at"]
+
+
+# streams listings from a CSV or JSONL file into the database. rows are read in
+# fixed-size chunks, validated (model validators, including the profanity check)
+# in a process pool and inserted with bulk_create, so memory stays bounded by
+# the chunk size whatever the size of the file
+class Command(BaseCommand):
+    help = "Bulk import listings from a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="validation processes, 0 validates in this process")
+        parser.add_argument("--rejects", help="where to write rejected rows, defaults to <path>.rejects.jsonl")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.isfile(path):
+            raise CommandError(f"{path} does not exist")
+        file_format = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        rejects_path = options["rejects"] or f"{path}.rejects.jsonl"
+        self.categories = {category.name: category for category in get_categories()}
+        imported = rejected = 0
+
+        with open(path, newline="", encoding="utf-8") as source, open(rejects_path, "w", encoding="utf-8") as rejects:
+            rows = read_csv(source) if file_format == "csv" else read_jsonl(source)
+            for valid, invalid in self.validate(chunks(rows, options["chunk_size"]), options["workers"]):
+                listings, unresolved = self.resolve(valid)
+                invalid += unresolved
+                if listings:
+                    with transaction.atomic():
+                        Listing.objects.bulk_create(listings)
+                    imported += len(listings)
+                for line, row, errors in invalid:
+                    rejects.write(json.dumps({"line": line, "errors": errors, "row": row}) + "\n")
+                rejected += len(invalid)
+
+        # bulk_create skips the signals that keep the cached counts and the category stats fresh
+        for category in self.categories.values():
+            invalidate_listing_count(category.id)
+        reconcile_category_stats([category.id for category in self.categories.values()])
+
+        self.stdout.write(f"imported {imported} listings, rejected {rejected} (see {rejects_path})")
+
+    # validated chunks in input order, with at most two chunks per worker in flight
+    def validate(self, chunks, workers):
+        if not workers:
+            for chunk in chunks:
+                yield validate_chunk(chunk)
+            return
+
+        # forked workers must not share this process' database connections
+        connections.close_all()
+        with ProcessPoolExecutor(workers, initializer=django.setup) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(validate_chunk, chunk))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    # attach users and categories, one user query per chunk
+    def resolve(self, valid):
+        usernames = {row["user"] for _, row, _ in valid}
+        users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+        listings = []
+        unresolved = []
+        for line, row, fields in valid:
+            user = users.get(row["user"])
+            category = self.categories.get(row["category"])
+            if user is None or category is None:
+                errors = {}
+                if user is None:
+                    errors["user"] = [f"Unknown user {row['user']!r}"]
+                if category is None:
+                    errors["category"] = [f"Unknown category {row['category']!r}"]
+                unresolved.append((line, row, errors))
+                continue
+            listings.append(Listing(user=user, category=category, **fields))
+        return listings, unresolved
+
+
+def read_csv(source):
+    reader = csv.DictReader(source)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(source):
+    for line, text in enumerate(source, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as e:
+            row = {"__error__": f"Invalid JSON: {e}"}
+        if not isinstance(row, dict):
+            row = {"__error__": "Not a JSON object"}
+        yield line, row
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+# runs in the worker processes: model validation without touching the database.
+# returns the valid rows with their cleaned field values, and the invalid rows with their errors
+def validate_chunk(chunk):
+    valid = []
+    invalid = []
+    for line, row in chunk:
+        if "__error__" in row:
+            invalid.append((line, None, {"row": [row["__error__"]]}))
+            continue
+        row = {field: str(row.get(field) or "").strip() for field in FIELDS}
+        listing = Listing(
+            title=row["title"],
+            description=row["description"],
+            value=row["starting_bid"],
+            image=row["image"] or None,
+            ends_at=row["ends_at"] or None,
+        )
+        try:
+            # users and categories are checked by the parent process
+            listing.full_clean(exclude=["user", "category", "winner", "high_bidder"], validate_unique=False, validate_constraints=False)
+        except ValidationError as e:
+            invalid.append((line, row, e.message_dict))
+            continue
+        valid.append((line, row, {
+            "title": listing.title,
+            "description": listing.description,
+            "value": listing.value,
+            "image": listing.image,
+            "ends_at": listing.ends_at,
+        }))
+    return valid, invalid
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from auctions.services import reconcile_category_stats
+
+
+# the category stats are updated incrementally, this recounts them from the
+# listings and fixes any drift. run it periodically from cron
+class Command(BaseCommand):
+    help = "Recount the per category statistics and fix any drift"
+
+    def handle(self, *args, **options):
+        fixed = reconcile_category_stats()
+        self.stdout.write(f"fixed {fixed} categories")
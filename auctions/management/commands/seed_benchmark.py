@@ -0,0 +1,146 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from auctions.caching import invalidate_categories
+from auctions.models import User, Category, Listing, Bid, Comment, Watchlist
+from auctions.pagination import invalidate_listing_count
+from auctions.services import reconcile_category_stats
+
+
+CATEGORIES = ["Antiques", "Books", "Cameras", "Clothing", "Collectibles", "Computers", "Garden", "Home", "Jewellery", "Music", "Phones", "Sports", "Tools", "Toys", "Vehicles", "Video games"]
+ADJECTIVES = ["Vintage", "Used", "Brand new", "Rare", "Classic", "Compact", "Large", "Small", "Handmade", "Signed", "Refurbished", "Boxed"]
+NOUNS = ["lamp", "camera", "bicycle", "guitar", "watch", "chair", "novel", "jacket", "drill", "console", "vase", "record", "phone", "kettle", "tent"]
+PHRASES = [
+    "In good working order.", "Some signs of wear.", "Comes with the original box.", "Collection only.",
+    "Ships within two days.", "Barely used.", "From a smoke free home.", "Includes all accessories.",
+    "Minor scratches on the side.", "Sold as seen.", "Perfect as a gift.", "Battery holds its charge.",
+]
+COMMENTS = ["Is this still available?", "Does it ship abroad?", "What are the dimensions?", "Any scratches?", "Would you take an offer?", "Great item!", "How old is it?"]
+
+
+# Generates a realistic data set for the benchmarks: users, categories, listings
+# with their bids (most listings get a few, a few get very many), comments and
+# watchlists. Everything is inserted with bulk_create, listing by listing batch,
+# so memory stays flat whatever the size. bulk_create skips Bid.save, so the bid
+# summary (current_price, high_bidder, bid_count) is filled in directly.
+class Command(BaseCommand):
+    help = "Seed the database with users, listings, bids, comments and watchlists for benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5000)
+        parser.add_argument("--listings", type=int, default=100_000)
+        parser.add_argument("--bids", type=int, default=1_000_000, help="total number of bids, spread unevenly over the listings")
+        parser.add_argument("--comments", type=int, default=200_000)
+        parser.add_argument("--watchlists", type=int, default=200_000)
+        parser.add_argument("--closed", type=float, default=0.2, help="share of listings that are closed")
+        parser.add_argument("--batch-size", type=int, default=1000, help="listings generated and inserted at a time")
+        parser.add_argument("--seed", type=int, default=0, help="random seed, the same seed generates the same data")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.now = timezone.now()
+        start = time.perf_counter()
+
+        users = self.seed_users(options["users"])
+        categories = self.seed_categories()
+        self.stdout.write(f"{len(users)} users, {len(categories)} categories")
+
+        listings = options["listings"]
+        # bids per listing follow a long tail with the requested mean
+        mean_bids = options["bids"] / listings if listings else 0
+        totals = {"listings": 0, "bids": 0, "comments": 0, "watchlists": 0}
+        for offset in range(0, listings, options["batch_size"]):
+            size = min(options["batch_size"], listings - offset)
+            with transaction.atomic():
+                counts = self.seed_batch(size, users, categories, mean_bids, options)
+            for name, count in counts.items():
+                totals[name] += count
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{totals['listings']} listings, {totals['bids']} bids")
+
+        # bulk_create skips the signals that keep the caches and the category stats fresh
+        invalidate_categories()
+        for category in categories:
+            invalidate_listing_count(category.id)
+        reconcile_category_stats([category.id for category in categories])
+
+        self.stdout.write(", ".join(f"{count} {name}" for name, count in totals.items()) + f" in {time.perf_counter() - start:.1f}s")
+
+    def seed_users(self, count):
+        # bulk_create does not hash passwords, seeded users can not log in with one
+        User.objects.bulk_create([User(username=f"seed_user{i}", password="!") for i in range(count)], ignore_conflicts=True, batch_size=1000)
+        return list(User.objects.filter(username__startswith="seed_user").values_list("id", flat=True))
+
+    def seed_categories(self):
+        Category.objects.bulk_create([Category(name=name) for name in CATEGORIES], ignore_conflicts=True)
+        return list(Category.objects.filter(name__in=CATEGORIES))
+
+    def seed_batch(self, size, users, categories, mean_bids, options):
+        rand = self.random
+        listings = []
+        bid_values = []
+        for _ in range(size):
+            created = self.now - timedelta(days=rand.uniform(0, 90))
+            value = Decimal(round(rand.lognormvariate(3, 1.2), 2)).quantize(Decimal("0.01")) or Decimal("1.00")
+            value = min(value, Decimal("5000.00"))
+            seller = rand.choice(users)
+            # long tail: most listings get a few bids, some get a lot
+            count = int(rand.expovariate(1 / mean_bids)) if mean_bids else 0
+            bids = []
+            price = value
+            for _ in range(count):
+                bids.append((price, rand.choice(users)))
+                price += max(Decimal("0.50"), (price * Decimal("0.05")).quantize(Decimal("0.01")))
+                if price >= Decimal("99999.00"):
+                    break
+            closed = rand.random() < options["closed"]
+            timed = not closed and rand.random() < 0.5
+            listing = Listing(
+                title=f"{rand.choice(ADJECTIVES)} {rand.choice(NOUNS)}",
+                description=" ".join(rand.sample(PHRASES, 3)),
+                value=value,
+                user_id=seller,
+                category=rand.choice(categories),
+                created=created,
+                active=not closed,
+                current_price=bids[-1][0] if bids else None,
+                high_bidder_id=bids[-1][1] if bids else None,
+                bid_count=len(bids),
+                ends_at=self.now + timedelta(days=rand.uniform(0.1, 14)) if timed else None,
+            )
+            if closed:
+                listing.winner_id = listing.high_bidder_id
+                listing.closed_at = min(self.now, created + timedelta(days=rand.uniform(1, 14)))
+            listings.append(listing)
+            bid_values.append(bids)
+
+        Listing.objects.bulk_create(listings)
+
+        bids = []
+        for listing, values in zip(listings, bid_values):
+            moment = listing.created
+            for value, user in values:
+                moment += timedelta(minutes=rand.uniform(1, 600))
+                bids.append(Bid(listing_id=listing.id, user_id=user, value=value, created=moment))
+        Bid.objects.bulk_create(bids, batch_size=5000)
+
+        per_listing = options["comments"] / options["listings"]
+        comments = [
+            Comment(listing_id=listing.id, user_id=rand.choice(users), comment=rand.choice(COMMENTS))
+            for listing in listings for _ in range(int(rand.expovariate(1 / per_listing)) if per_listing else 0)
+        ]
+        Comment.objects.bulk_create(comments, batch_size=5000)
+
+        per_listing = options["watchlists"] / options["listings"]
+        watchlists = {
+            (rand.choice(users), listing.id)
+            for listing in listings for _ in range(int(rand.expovariate(1 / per_listing)) if per_listing else 0)
+        }
+        Watchlist.objects.bulk_create([Watchlist(user_id=user, listing_id=listing) for user, listing in watchlists], batch_size=5000, ignore_conflicts=True)
+
+        return {"listings": len(listings), "bids": len(bids), "comments": len(comments), "watchlists": len(watchlists)}
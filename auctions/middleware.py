@@ -0,0 +1,241 @@
+import logging
+import mimetypes
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from .instrumentation import RequestStats, current_stats, view_counters
+from .routers import ReadState, read_state
+
+
+logger = logging.getLogger("auctions.performance")
+
+# set after a request wrote to the database, while present reads go to the primary
+PRIMARY_COOKIE = "auctions_primary"
+
+# hashed file names change with their content, they can be cached for good
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# plain names (linked from outside the templates) are checked again after a minute
+STATIC_CACHE_CONTROL = "public, max-age=60"
+
+# precompressed copies written by CompressedManifestStaticFilesStorage, best first
+STATIC_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+# Measures every request: number of SQL queries, time in SQL, template render time
+# and total time. The numbers go out in a Server-Timing header (shown by the browser
+# dev tools), are added to the per view counters (see view_counters) and requests
+# over the AUCTIONS_SLOW_* thresholds are logged with their repeated queries.
+# For streamed responses the total is the time until the response starts.
+class RequestTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.finish(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.finish(request, response, stats)
+        return response
+
+    def finish(self, request, response, stats):
+        total = time.perf_counter() - stats.start
+        response["Server-Timing"] = ", ".join([
+            f'sql;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries"',
+            f"render;dur={stats.render_time * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ])
+
+        duplicates = stats.duplicates(settings.AUCTIONS_SLOW_DUPLICATE_QUERIES)
+        slow = (
+            total * 1000 >= settings.AUCTIONS_SLOW_REQUEST_MS
+            or stats.queries >= settings.AUCTIONS_SLOW_QUERY_COUNT
+            or bool(duplicates)
+        )
+        match = request.resolver_match
+        view_name = match.view_name if match else "<unresolved>"
+        view_counters.add(view_name, stats, total, response.status_code, slow)
+
+        if slow:
+            logger.warning(
+                "slow request %s %s (%s): %.1f ms total, %d queries in %.1f ms, render %.1f ms%s",
+                request.method, request.path, view_name, total * 1000, stats.queries, stats.sql_time * 1000, stats.render_time * 1000,
+                "".join(f"\n  {count}x {sql}" for sql, count in duplicates),
+            )
+
+
+# Keeps a user's reads on the primary database for AUCTIONS_PRIMARY_STICKY_SECONDS
+# after a request of theirs wrote something (see PrimaryReplicaRouter). Does
+# nothing without read replicas. Comes before the session middleware, so a
+# session that was just written is read back from the primary too.
+class PrimaryPinMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.AUCTIONS_READ_REPLICAS:
+            return self.get_response(request)
+        state = ReadState(pinned=PRIMARY_COOKIE in request.COOKIES)
+        token = read_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            read_state.reset(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        if not settings.AUCTIONS_READ_REPLICAS:
+            return await self.get_response(request)
+        state = ReadState(pinned=PRIMARY_COOKIE in request.COOKIES)
+        token = read_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_state.reset(token)
+        return self.finish(response, state)
+
+    def finish(self, response, state):
+        if state.wrote:
+            # the window starts again with every write
+            response.set_cookie(PRIMARY_COOKIE, "1", max_age=settings.AUCTIONS_PRIMARY_STICKY_SECONDS, httponly=True, samesite="Lax")
+        return response
+
+
+class StaticFile:
+    __slots__ = ("content_type", "immutable", "last_modified", "variants")
+
+    def __init__(self, path, immutable):
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.immutable = immutable
+        self.last_modified = os.stat(path).st_mtime
+        # (encoding, file, etag), the uncompressed file last
+        self.variants = []
+        for encoding, suffix in STATIC_ENCODINGS:
+            if os.path.exists(path + suffix):
+                self.variants.append((encoding, path + suffix, file_etag(path + suffix)))
+        self.variants.append((None, path, file_etag(path)))
+
+
+def file_etag(path):
+    stat = os.stat(path)
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+# content codings of an Accept-Encoding header, without the ones refused with q=0
+def accepted_encodings(header):
+    accepted = set()
+    for part in header.split(","):
+        coding, _, parameters = part.partition(";")
+        parameters = parameters.replace(" ", "")
+        if parameters.startswith("q="):
+            try:
+                if float(parameters[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+# Serves the files collected to STATIC_ROOT from the app itself, no separate web
+# server needed. STATIC_ROOT is scanned once at startup. Files with a content
+# hash in their name (see CompressedManifestStaticFilesStorage) are sent with a
+# far future immutable Cache-Control, and as their .br or .gz copy when the
+# browser accepts it. Not used with DEBUG, runserver serves the app's static
+# directories then. Goes before the session middleware, static requests skip
+# everything after it.
+class StaticFilesMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.DEBUG or not settings.STATIC_ROOT or not os.path.isdir(settings.STATIC_ROOT):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL
+        self.files = self.scan(settings.STATIC_ROOT)
+
+    def scan(self, root):
+        hashed = set(getattr(staticfiles_storage, "hashed_files", {}).values())
+        compressed = tuple(suffix for _, suffix in STATIC_ENCODINGS)
+        files = {}
+        for directory, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.endswith(compressed) and os.path.exists(path.rsplit(".", 1)[0]):
+                    continue
+                url = os.path.relpath(path, root).replace(os.sep, "/")
+                files[url] = StaticFile(path, url in hashed)
+        return files
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # static files are small, reading one does not hold up the event loop for long
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        if request.method not in ("GET", "HEAD") or not request.path.startswith(self.prefix):
+            return None
+        static = self.files.get(request.path[len(self.prefix):])
+        if static is None:
+            return None
+
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        encoding, path, etag = next(variant for variant in static.variants if variant[0] is None or variant[0] in accepted)
+        response = HttpResponse(content_type=static.content_type)
+        response["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if static.immutable else STATIC_CACHE_CONTROL
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(static.last_modified)
+        if encoding:
+            response["Content-Encoding"] = encoding
+        if len(static.variants) > 1:
+            patch_vary_headers(response, ("Accept-Encoding",))
+
+        conditional = get_conditional_response(request, etag=etag, last_modified=static.last_modified, response=response)
+        if conditional is not response:
+            return conditional
+        with open(path, "rb") as file:
+            response.content = file.read()
+        return response
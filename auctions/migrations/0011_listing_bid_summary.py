@@ -0,0 +1,46 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+# fill the bid summary of existing listings from their bids
+def backfill_bid_summary(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Bid = apps.get_model('auctions', 'Bid')
+    # the first bid placed at the highest value is the one that won the lead
+    top_bid = Bid.objects.filter(listing=OuterRef('pk')).order_by('-value', 'id')
+    bid_count = Bid.objects.filter(listing=OuterRef('pk')).values('listing').annotate(total=Count('id')).values('total')
+    Listing.objects.filter(pk__in=Bid.objects.values('listing')).update(
+        current_price=Subquery(top_bid.values('value')[:1]),
+        high_bidder=Subquery(top_bid.values('user')[:1]),
+        bid_count=Subquery(bid_count),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0010_listing_winner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='current_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='high_bidder',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='leading_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_bid_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:39
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+# keep only the first row of every duplicated (user, listing) pair so the unique constraint can be added
+def remove_duplicate_watchlist_rows(apps, schema_editor):
+    Watchlist = apps.get_model('auctions', 'Watchlist')
+    keep = Watchlist.objects.values('user', 'listing').annotate(first_id=Min('id')).values('first_id')
+    Watchlist.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0011_listing_bid_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['listing', '-value'], name='bid_listing_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', True)), fields=['-id'], name='listing_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('active', True)), fields=['category', '-id'], name='listing_category_active_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_watchlist_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='watchlist',
+            constraint=models.UniqueConstraint(fields=('user', 'listing'), name='watchlist_user_listing_unique'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0013_timed_auctions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bid',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
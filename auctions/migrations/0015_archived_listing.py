@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:04
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0014_bid_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedListing',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=100)),
+                ('description', models.CharField(max_length=1000)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('image', models.URLField(blank=True, null=True)),
+                ('current_price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('bid_count', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField()),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('closed_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('bids', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('comments', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_listings', to='auctions.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_listings', to=settings.AUTH_USER_MODEL)),
+                ('winner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_wins', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.2 on 2026-10-18 17:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import Coalesce
+
+
+# count the existing listings of every category
+def backfill_category_stats(apps, schema_editor):
+    Category = apps.get_model('auctions', 'Category')
+    CategoryStats = apps.get_model('auctions', 'CategoryStats')
+    Listing = apps.get_model('auctions', 'Listing')
+    ArchivedListing = apps.get_model('auctions', 'ArchivedListing')
+    stats = {category_id: CategoryStats(category_id=category_id) for category_id in Category.objects.values_list('id', flat=True)}
+    price = Coalesce('current_price', 'value')
+    for row in Listing.objects.values('category', 'active').annotate(count=Count('id'), bids=Sum('bid_count'), min_price=Min(price), max_price=Max(price)):
+        category = stats[row['category']]
+        category.bids += row['bids']
+        if row['active']:
+            category.active_listings = row['count']
+            category.min_price = row['min_price']
+            category.max_price = row['max_price']
+        else:
+            category.closed_listings += row['count']
+    for row in ArchivedListing.objects.values('category').annotate(count=Count('id'), bids=Sum('bid_count')):
+        stats[row['category']].closed_listings += row['count']
+        stats[row['category']].bids += row['bids']
+    CategoryStats.objects.bulk_create(stats.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0015_archived_listing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='auctions.category')),
+                ('active_listings', models.IntegerField(default=0)),
+                ('closed_listings', models.IntegerField(default=0)),
+                ('bids', models.IntegerField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_category_stats, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,11 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Min, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
 from django.core.exceptions import ValidationError
-from better_profanity import profanity
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from .profanity import contains_profanity
 
 
 # custom validator used by Listing model
@@ -11,7 +15,7 @@ def validate_price(value):
 
 # custom validator used by Listing model
 def validate_profanity(text):
-    if profanity.contains_profanity(text):
+    if contains_profanity(text):
         raise ValidationError(f"Contains a bad word")
 
 class User(AbstractUser):
@@ -34,6 +38,24 @@ class Listing(models.Model):
     user = models.ForeignKey(User, default=None, on_delete=models.CASCADE, related_name="creator")
     category = models.ForeignKey(Category, default=None, on_delete=models.CASCADE, related_name="category")
     winner = models.ForeignKey(User, default=None, on_delete=models.PROTECT, related_name="winner", blank=True, null=True)
+    # highest bid so far, kept up to date by Bid.save so we never scan listing_bids
+    current_price = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    high_bidder = models.ForeignKey(User, default=None, on_delete=models.PROTECT, related_name="leading_listings", blank=True, null=True)
+    bid_count = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(default=timezone.now)
+    # timed auctions are closed automatically once ends_at has passed (see close_expired_listings)
+    ends_at = models.DateTimeField(blank=True, null=True)
+    closed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # browsing: active listings (optionally in one category), newest first.
+            # partial indexes because Django filters on the bare boolean column
+            models.Index(fields=["-id"], condition=Q(active=True), name="listing_active_idx"),
+            models.Index(fields=["category", "-id"], condition=Q(active=True), name="listing_category_active_idx"),
+            # open timed auctions by end time, for the auto-close worker
+            models.Index(fields=["ends_at"], condition=Q(active=True, ends_at__isnull=False), name="listing_ends_at_idx"),
+        ]
 
     # custom string representation
     def __str__(self):
@@ -51,14 +73,147 @@ class Bid(models.Model):
     value = models.DecimalField(max_digits=7, decimal_places=2, validators=[validate_price])
     user = models.ForeignKey(User, default=None, on_delete=models.CASCADE, related_name="bids")
     listing = models.ForeignKey(Listing, default=None, on_delete=models.PROTECT, related_name="listing_bids")
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # top bid of a listing
+            models.Index(fields=["listing", "-value"], name="bid_listing_value_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        # the bid and the listing summary are written in the same transaction
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+            if adding:
+                # only take over the listing when this bid beats the current price
+                higher = Q(current_price__isnull=True) | Q(current_price__lt=self.value)
+                Listing.objects.filter(pk=self.listing_id).update(
+                    bid_count=F("bid_count") + 1,
+                    current_price=Case(When(higher, then=Value(self.value)), default=F("current_price"), output_field=models.DecimalField()),
+                    high_bidder=Case(When(higher, then=Value(self.user_id)), default=F("high_bidder"), output_field=models.IntegerField()),
+                )
+                # the listing as it was before this bid
+                listing = self.listing
+                CategoryStats.bid_placed(listing.category_id, listing.current_price or listing.value, self.value)
 
     def __str__(self):
         return f"ID:{self.id}: {self.value} bid by {self.user}\n"
 
+# Live numbers per category for the categories page, kept up to date as listings
+# are created and closed and bids are placed (see the classmethods), so the page
+# never aggregates the listings. manage.py reconcile_category_stats recounts them
+# from scratch to fix any drift, e.g. after bulk imports that skip the updates.
+class CategoryStats(models.Model):
+    category = models.OneToOneField(Category, primary_key=True, on_delete=models.CASCADE, related_name="stats")
+    active_listings = models.IntegerField(default=0)
+    # closed listings, archived ones included
+    closed_listings = models.IntegerField(default=0)
+    bids = models.IntegerField(default=0)
+    # lowest and highest current price (highest bid or starting bid) of the active listings
+    min_price = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    max_price = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+
+    @staticmethod
+    def active_price(aggregate):
+        # the lowest (Min) or highest (Max) current price of the category's active listings, as a subquery
+        return Subquery(
+            Listing.objects.filter(active=True, category=OuterRef("category"))
+            .values("category")
+            .annotate(price=aggregate(Coalesce("current_price", "value")))
+            .values("price")
+        )
+
+    @classmethod
+    def listing_added(cls, category_id, price, active=True, bids=0):
+        if not active:
+            cls.objects.filter(category=category_id).update(closed_listings=F("closed_listings") + 1, bids=F("bids") + bids)
+            return
+        cls.objects.filter(category=category_id).update(
+            active_listings=F("active_listings") + 1,
+            bids=F("bids") + bids,
+            min_price=Coalesce(Least("min_price", Value(price)), Value(price)),
+            max_price=Coalesce(Greatest("max_price", Value(price)), Value(price)),
+        )
+
+    # a deleted active listing can take away the lowest or highest price, those are looked up again
+    @classmethod
+    def listing_removed(cls, category_id, active, bids):
+        if not active:
+            cls.objects.filter(category=category_id).update(closed_listings=F("closed_listings") - 1, bids=F("bids") - bids)
+            return
+        cls.objects.filter(category=category_id).update(
+            active_listings=F("active_listings") - 1,
+            bids=F("bids") - bids,
+            min_price=cls.active_price(Min),
+            max_price=cls.active_price(Max),
+        )
+
+    @classmethod
+    def bid_placed(cls, category_id, old_price, price):
+        cls.objects.filter(category=category_id).update(
+            bids=F("bids") + 1,
+            max_price=Coalesce(Greatest("max_price", Value(price)), Value(price)),
+            # only the listing that had the lowest price can raise the minimum
+            min_price=Case(When(min_price__gte=old_price, then=cls.active_price(Min)), default=F("min_price")),
+        )
+
+    # closing can take away the lowest or highest price, those are looked up again
+    @classmethod
+    def listings_closed(cls, closed_per_category):
+        for category_id, closed in closed_per_category.items():
+            cls.objects.filter(category=category_id).update(
+                active_listings=F("active_listings") - closed,
+                closed_listings=F("closed_listings") + closed,
+                min_price=cls.active_price(Min),
+                max_price=cls.active_price(Max),
+            )
+
+    def __str__(self):
+        return f"{self.category_id}: {self.active_listings} active listings\n"
+
 # Watchlist is a many-to-many relationship between User and Listing
 class Watchlist(models.Model):
     user = models.ForeignKey(User, default=None, on_delete=models.CASCADE, related_name="watchlist")
     listing = models.ForeignKey(Listing, default=None, on_delete=models.CASCADE, related_name="watchlist_listings")
 
+    class Meta:
+        constraints = [
+            # a user watches a listing at most once, this also indexes (user, listing) lookups
+            models.UniqueConstraint(fields=["user", "listing"], name="watchlist_user_listing_unique"),
+        ]
+
     def __inint__(self):
         return f"User: {self.user} is Watching : {self.listing}\n"
+
+
+# Closed listings are moved here by archive_closed_listings once they are old
+# enough, so the live tables only hold what is still being browsed and bid on.
+# The id is the original listing id. Bids and comments are kept inline as JSON,
+# an archived listing is a single row.
+class ArchivedListing(models.Model):
+    id = models.IntegerField(primary_key=True)
+    title = models.CharField(max_length=100)
+    description = models.CharField(max_length=1000)
+    value = models.DecimalField(max_digits=12, decimal_places=2)
+    image = models.URLField(blank=True, null=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_listings")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="archived_listings")
+    winner = models.ForeignKey(User, on_delete=models.PROTECT, related_name="archived_wins", blank=True, null=True)
+    current_price = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    bid_count = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField()
+    ends_at = models.DateTimeField(blank=True, null=True)
+    closed_at = models.DateTimeField(blank=True, null=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+    # [[user id, value, created], ...] oldest first
+    bids = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    # [[user id, comment], ...] oldest first
+    comments = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+
+    # an archived listing is always closed, templates check listing.active
+    active = False
+
+    def __str__(self):
+        return f"ID: {self.id}: {self.title} (archived)\n"
@@ -0,0 +1,61 @@
+from django.core.cache import cache
+
+
+# number of listings shown per page
+PAGE_SIZE = 24
+# number of comments shown per page
+COMMENTS_PAGE_SIZE = 20
+# how long (in seconds) a cached listing count may be served
+COUNT_TIMEOUT = 60
+
+
+# read the cursor from the query string, a bad cursor just means the first page
+def get_cursor(request, name="after"):
+    try:
+        return int(request.GET[name])
+    except (KeyError, ValueError):
+        return None
+
+
+# keyset (cursor) pagination on id, newest first. instead of OFFSET we continue
+# below the last id of the previous page so every page costs the same
+def keyset_page(queryset, after=None, size=PAGE_SIZE):
+    if after is not None:
+        queryset = queryset.filter(id__lt=after)
+    # fetch one extra row to find out if there is a next page
+    items = list(queryset.order_by("-id")[:size + 1])
+    next_cursor = items[size - 1].id if len(items) > size else None
+    return items[:size], next_cursor
+
+
+# async version of keyset_page for the async views
+async def akeyset_page(queryset, after=None, size=PAGE_SIZE):
+    if after is not None:
+        queryset = queryset.filter(id__lt=after)
+    items = [item async for item in queryset.order_by("-id")[:size + 1]]
+    next_cursor = items[size - 1].id if len(items) > size else None
+    return items[:size], next_cursor
+
+
+def listing_count_key(category_id=None):
+    return f"listings:count:{category_id or 'all'}"
+
+
+# number of active listings (optionally in one category), cached so the index
+# page does not count the whole table on every request
+def active_listing_count(queryset, category_id=None):
+    return cache.get_or_set(listing_count_key(category_id), queryset.count, COUNT_TIMEOUT)
+
+
+async def aactive_listing_count(queryset, category_id=None):
+    key = listing_count_key(category_id)
+    count = await cache.aget(key)
+    if count is None:
+        count = await queryset.acount()
+        await cache.aset(key, count, COUNT_TIMEOUT)
+    return count
+
+
+# drop the cached counts a listing contributes to
+def invalidate_listing_count(category_id):
+    cache.delete_many([listing_count_key(), listing_count_key(category_id)])
@@ -0,0 +1,105 @@
+import re
+
+from better_profanity import profanity
+from better_profanity.constants import ALLOWED_CHARACTERS
+
+
+# A drop-in replacement for better_profanity's contains_profanity that gives the
+# same verdicts but is compiled once. better_profanity compares every word of the
+# text against each of its ~1000 censor words one by one (expanding the leetspeak
+# variants on every comparison), we instead walk a trie of the censor words where
+# every written character follows all the wordlist characters it can stand for.
+class ProfanityMatcher:
+
+    def __init__(self, words, char_map, max_words):
+        # censor words that span several words (e.g. "2 girls 1 cup") are matched
+        # against up to max_words following words
+        self.max_words = max_words
+
+        # trie of the censor words, the None key marks the end of a word
+        self._trie = {}
+        for word in words:
+            node = self._trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[None] = True
+
+        # written character -> the wordlist characters it can stand for,
+        # e.g. "1" can be an "i" or an "l". characters not in the map stand for themselves
+        self._sources = {}
+        for char, variants in char_map.items():
+            for variant in variants:
+                self._sources.setdefault(variant, set()).add(char)
+        for written in self._sources:
+            if written not in char_map:
+                self._sources[written].add(written)
+        self._sources = {written: tuple(chars) for written, chars in self._sources.items()}
+
+        # a word is a run of the characters better_profanity allows in words
+        allowed = "".join(re.escape(char) for char in sorted(ALLOWED_CHARACTERS))
+        self._word_re = re.compile(f"[{allowed}]+")
+
+    # follow text from the given trie nodes, returns the nodes reached (empty when nothing matches)
+    def _walk(self, nodes, text):
+        for written in text:
+            nodes = [child for node in nodes for char in self._sources.get(written, (written,)) if (child := node.get(char)) is not None]
+            if not nodes:
+                break
+        return nodes
+
+    # True when text (a single candidate word or phrase) is a censor word
+    def is_censor_word(self, text):
+        return any(None in node for node in self._walk([self._trie], text))
+
+    def contains_profanity(self, text):
+        if not isinstance(text, str):
+            text = str(text)
+        last_index = len(text) - 1
+        words = [(match.group(), match.start(), match.end()) for match in self._word_re.finditer(text)]
+
+        # same as better_profanity: no words, or a text whose first word starts on
+        # its last character is never censored
+        if not words or words[0][1] >= last_index:
+            return False
+
+        for i, (word, start, end) in enumerate(words):
+            nodes = self._walk([self._trie], word.lower())
+            if any(None in node for node in nodes):
+                return True
+            # the last word of the text is only checked on its own
+            if end > last_index:
+                continue
+
+            # the word combined with the next ones, with and without the separators.
+            # both are walked incrementally and dropped as soon as no censor word starts with them
+            joined = with_separators = nodes
+            previous_end = end
+            for next_word, next_start, next_end in words[i + 1:i + 1 + self.max_words]:
+                # a one character word at the very end of the text is never combined
+                if not (joined or with_separators) or next_start >= last_index:
+                    break
+                joined = self._walk(joined, next_word.lower())
+                with_separators = self._walk(with_separators, f"{text[previous_end:next_start]}{next_word}".lower())
+                if any(None in node for node in joined + with_separators):
+                    return True
+                previous_end = next_end
+        return False
+
+
+_matcher = None
+
+
+# the matcher for better_profanity's default wordlist, compiled on first use
+def get_matcher():
+    global _matcher
+    if _matcher is None:
+        _matcher = ProfanityMatcher(
+            [str(word) for word in profanity.CENSOR_WORDSET],
+            profanity.CHARS_MAPPING,
+            profanity.MAX_NUMBER_COMBINATIONS,
+        )
+    return _matcher
+
+
+def contains_profanity(text):
+    return get_matcher().contains_profanity(text)
@@ -0,0 +1,95 @@
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+
+# Rate limits for the views that write to the database (bids, comments, watch
+# toggles): a client may send `requests` per `seconds` for each scope
+# (AUCTIONS_RATE_LIMITS), over that it gets a 429 with Retry-After before the view
+# touches the database. Logged in clients are keyed by user (read from the
+# session, not the database), the others by IP address.
+#
+# Sliding window counters, not token buckets: a token bucket has to read its
+# tokens and the time of the last refill, then write both back, and Django's
+# cache API has no compare-and-set to do that atomically, so two concurrent
+# requests could both take the last token. Instead requests are counted per
+# window of `seconds` with cache.add and cache.incr, which are atomic in the
+# cache backends. The previous window's count is weighted by how much of it is
+# still within the last `seconds`, which smooths the burst a fixed window allows
+# at its edges, like a bucket of `requests` tokens refilled over `seconds`. It
+# is an estimate, Retry-After can be longer than an exact sliding window would give.
+# Counters live in the cache named by AUCTIONS_RATE_LIMIT_CACHE, it must be
+# shared between workers for the limits to hold across them.
+
+def client_key(request):
+    user_id = request.session.get(SESSION_KEY) if hasattr(request, "session") else None
+    if user_id is not None:
+        return f"user:{user_id}"
+    # behind a proxy REMOTE_ADDR has to be set to the client address by the proxy setup
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+# count a request of the client for scope, returns 0 when it may go ahead,
+# otherwise the seconds until it would be allowed (and it is not counted)
+def count_request(request, scope, now=None):
+    requests, seconds = settings.AUCTIONS_RATE_LIMITS[scope]
+    cache = caches[settings.AUCTIONS_RATE_LIMIT_CACHE]
+    now = time.time() if now is None else now
+    window, elapsed = divmod(now, seconds)
+    key = f"ratelimit:{scope}:{client_key(request)}:"
+    current = f"{key}{int(window)}"
+
+    # a window is still read as the previous one during the next, then it can go
+    cache.add(current, 0, seconds * 2)
+    try:
+        count = cache.incr(current)
+    except ValueError:
+        # expired between add and incr
+        cache.add(current, 0, seconds * 2)
+        count = cache.incr(current)
+    previous = cache.get(f"{key}{int(window) - 1}", 0)
+    if previous * (1 - elapsed / seconds) + count <= requests:
+        return 0
+
+    cache.decr(current)
+    count -= 1
+    if count < requests:
+        # room in this window once enough of the previous one has slid out
+        wait = (1 - (requests - count - 1) / previous) * seconds - elapsed
+    else:
+        # this window is full, in the next one it is the previous window
+        wait = seconds - elapsed + (1 - (requests - 1) / count) * seconds
+    # never 0, that would let the uncounted request through
+    return max(wait, 0.001)
+
+
+# limit a view, scope is a key of AUCTIONS_RATE_LIMITS or a function of the request
+# returning one (or None for no limit). only the given methods are limited. json
+# views get the {"success": false} body their scripts expect
+def rate_limit(scope, methods=("POST",), json=False):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            name = scope(request) if callable(scope) else scope
+            if request.method in methods and name is not None:
+                wait = count_request(request, name)
+                if wait:
+                    return too_many_requests(math.ceil(wait), json)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def too_many_requests(retry_after, json):
+    message = f"Too many requests, please try again in {retry_after} second{'s' if retry_after != 1 else ''}."
+    if json:
+        response = JsonResponse({"success": False, "message": message}, status=429)
+    else:
+        response = HttpResponse(message, content_type="text/plain", status=429)
+    response["Retry-After"] = str(retry_after)
+    return response
@@ -0,0 +1,76 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Reads go to one of the AUCTIONS_READ_REPLICAS, writes to the primary (default).
+# A request (or thread) reads from the same replica throughout, so one page never
+# mixes replicas that lag by different amounts. Replicas lag behind, so once the current request (or thread) has written
+# anything its reads stay on the primary, and PrimaryPinMiddleware keeps the
+# user's next requests there for AUCTIONS_PRIMARY_STICKY_SECONDS, which makes a
+# new bid or comment show up right away.
+
+class ReadState:
+    __slots__ = ("pinned", "wrote", "replica")
+
+    def __init__(self, pinned=False):
+        # read from the primary
+        self.pinned = pinned
+        # something was written, the user's next requests should read from the primary
+        self.wrote = False
+        # the replica reads go to, picked on the first read
+        self.replica = None
+
+
+# set per request by PrimaryPinMiddleware. it holds a mutable object so a write in
+# a sync_to_async thread is seen by the request it belongs to
+read_state = ContextVar("read_state", default=None)
+
+
+def _current_state():
+    state = read_state.get()
+    if state is None:
+        state = ReadState()
+        read_state.set(state)
+    return state
+
+
+def pin_to_primary():
+    state = _current_state()
+    state.pinned = state.wrote = True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.AUCTIONS_READ_REPLICAS
+        if not replicas:
+            return None
+        state = _current_state()
+        if state.pinned:
+            return DEFAULT_DB_ALIAS
+        # reads inside a transaction (select_for_update, read-then-write) must see the primary
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica not in replicas:
+            state.replica = random.choice(replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        if settings.AUCTIONS_READ_REPLICAS:
+            pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *settings.AUCTIONS_READ_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary
+        if db in settings.AUCTIONS_READ_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,87 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from .models import Listing
+
+
+# SQLite FTS5 index over the listing title and description. It is an external
+# content table, so it only stores the index and reads the text from auctions_listing
+FTS_TABLE = "auctions_listing_fts"
+
+FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, content='auctions_listing', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    # triggers keep the index in sync with every insert, update and delete, including bulk ones
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, description ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+# bm25 weights of the title and description columns, a hit in the title counts more
+BM25_WEIGHTS = (10.0, 1.0)
+
+
+# create the index and its triggers when they are missing. this runs after every
+# migrate because SQLite drops the triggers whenever a migration rebuilds auctions_listing
+def install_sqlite_fts(using_connection):
+    with using_connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s", [f"{FTS_TABLE}_%"])
+        complete = cursor.fetchone()[0] == len(FTS_SQL) - 1
+        if not complete:
+            for statement in FTS_SQL:
+                cursor.execute(statement)
+            # index the listings written while the triggers were missing
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+# turn user input into an FTS5 query: every word must match, quoted so that
+# FTS5 syntax (AND, NEAR, column filters, ...) typed by a user is taken literally
+def fts_query(text):
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", text))
+
+
+# listings matching text, best match first
+def search_listings(text, category_id=None, active=True):
+    listings = Listing.objects.all()
+    if active is not None:
+        listings = listings.filter(active=active)
+    if category_id:
+        listings = listings.filter(category_id=category_id)
+
+    if connection.vendor == "sqlite":
+        query = fts_query(text)
+        if not query:
+            return listings.none()
+        # bm25 is lower for better matches
+        return listings.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = auctions_listing.id", f"{FTS_TABLE} MATCH %s"],
+            params=[query],
+            select={"rank": f"bm25({FTS_TABLE}, %s, %s)"},
+            select_params=BM25_WEIGHTS,
+            order_by=["rank", "-id"],
+        )
+
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        vector = SearchVector("title", weight="A") + SearchVector("description", weight="B")
+        query = SearchQuery(text, search_type="websearch")
+        return listings.annotate(search=vector, rank=SearchRank(vector, query)).filter(search=query).order_by("-rank", "-id")
+
+    # other backends have no full text search that works without extra setup
+    words = re.findall(r"\w+", text)
+    if not words:
+        return listings.none()
+    for word in words:
+        listings = listings.filter(Q(title__icontains=word) | Q(description__icontains=word))
+    return listings.order_by("-id")
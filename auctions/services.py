@@ -0,0 +1,245 @@
+import random
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from .caching import invalidate_listing_card
+from .live import publish_bid, publish_close
+from .models import ArchivedListing, Category, CategoryStats, Listing, Bid, Comment, Watchlist
+from .pagination import invalidate_listing_count
+
+
+# raised when a bid is rejected, the message is safe to show to the bidder
+class BidError(Exception):
+    pass
+
+
+# SQLite reports a write lock held by another connection as "database is locked"
+# (or "database table is locked"), other OperationalErrors are not worth a retry
+def is_locked(error):
+    return "is locked" in str(error)
+
+
+# place a bid with an optimistic compare-and-swap on the listing.
+# the listing's bid_count acts as its version: the bid is only stored if nobody
+# else placed a bid since we read the listing, otherwise we re-read and retry
+def place_bid(listing_id, user, value, retries=5):
+    # another bid got in between our read and our update
+    lost = False
+    for attempt in range(retries):
+        try:
+            bid = _try_bid(listing_id, user, value, outbid=lost)
+        except OperationalError as error:
+            if not is_locked(error):
+                raise
+            # another bidder holds the write lock so back off a little
+            time.sleep(random.uniform(0, 0.01) * (attempt + 1))
+            continue
+        if bid is not None:
+            return bid
+        lost = True
+
+    raise BidError("Too many people are bidding right now, please try again")
+
+
+# one compare-and-swap attempt, returns None when another bid got in first
+def _try_bid(listing_id, user, value, outbid=False):
+    listing = Listing.objects.get(pk=listing_id)
+
+    ## BID REQUIREMENTS:
+
+    # 1. listing must still be open
+    if not listing.active:
+        raise BidError("This listing is closed")
+    if listing.ends_at is not None and listing.ends_at <= timezone.now():
+        raise BidError("This auction has ended")
+    # 2. bid must be the same or higher than listing value
+    if value < listing.value:
+        raise BidError("Bid can not be lower than item value")
+    # 3. bid must be higher than current highest bid
+    if listing.current_price is not None and value <= listing.current_price:
+        if outbid:
+            # somebody else got in first while we were trying
+            raise BidError(f"You were outbid, the current highest bid is {listing.current_price}")
+        raise BidError("Bid must be higher than current highest bid")
+
+    bid = Bid(value=value, user=user, listing=listing)
+    try:
+        # apply model validation
+        bid.full_clean()
+    except ValidationError:
+        raise BidError("Bid must be the same or higher than current value")
+
+    with transaction.atomic():
+        # claim the listing: the update only matches when the version we read is
+        # still current, and it holds the row (or the SQLite write lock) until commit
+        claimed = Listing.objects.filter(pk=listing_id, active=True, bid_count=listing.bid_count).update(
+            current_price=value,
+            high_bidder=user,
+        )
+        if not claimed:
+            return None
+        # Bid.save bumps bid_count, which invalidates every other bidder's version
+        bid.save()
+        # tell everybody watching the listing once the bid is stored
+        transaction.on_commit(lambda: publish_bid(bid))
+    return bid
+
+
+# close the given listings: the highest bidder (stored on the listing) wins.
+# one UPDATE for the whole batch, listings that are already closed are left alone
+# so it is safe to run from several workers. returns how many were closed
+def close_listings(listings, now=None):
+    now = now or timezone.now()
+    with transaction.atomic():
+        # the ones still open, locked so the category stats count each listing once
+        closing = list(
+            Listing.objects.select_for_update()
+            .filter(id__in=[listing.id for listing in listings], active=True)
+            .values_list("id", "category_id", "high_bidder_id")
+        )
+        if not closing:
+            return 0
+        closed = Listing.objects.filter(id__in=[id for id, _, _ in closing], active=True).update(
+            active=False,
+            winner=F("high_bidder"),
+            closed_at=now,
+        )
+        CategoryStats.listings_closed(Counter(category_id for _, category_id, _ in closing))
+        # update() skips the model signals, refresh what they would have. only for
+        # the listings closed here, the others were closed (and announced) before
+        transaction.on_commit(lambda: _listings_closed(closing))
+    return closed
+
+
+# (id, category_id, high_bidder_id) of every listing closed
+def _listings_closed(closing):
+    for category_id in {category_id for _, category_id, _ in closing}:
+        invalidate_listing_count(category_id)
+    for listing_id, _, high_bidder_id in closing:
+        invalidate_listing_card(listing_id)
+        publish_close(listing_id, high_bidder_id)
+
+
+# close one batch of timed auctions that have ended. the expired listings are
+# found through listing_ends_at_idx, returns how many were closed
+def close_expired_listings(batch_size=500, now=None):
+    now = now or timezone.now()
+    with transaction.atomic():
+        # skip_locked lets workers on databases with row locks take different batches,
+        # on SQLite the write lock serialises them and the UPDATE skips closed rows
+        expired = list(
+            Listing.objects.select_for_update(skip_locked=True)
+            .filter(active=True, ends_at__isnull=False, ends_at__lte=now)
+            .order_by("ends_at")
+            .only("id", "category_id", "high_bidder_id")[:batch_size]
+        )
+        if not expired:
+            return 0
+        return close_listings(expired, now)
+
+
+# set while archive_closed_listings deletes listings, they stay counted in the
+# category stats through the archive
+archiving = ContextVar("archiving", default=False)
+
+
+# move one batch of listings closed more than AUCTIONS_ARCHIVE_AFTER_DAYS ago
+# (or older_than) to ArchivedListing, together with their bids and comments.
+# watchlist entries of archived listings are dropped. the batch is copied and
+# deleted in one transaction, returns how many listings were archived
+def archive_closed_listings(batch_size=500, older_than=None, now=None):
+    now = now or timezone.now()
+    cutoff = now - (older_than if older_than is not None else timedelta(days=settings.AUCTIONS_ARCHIVE_AFTER_DAYS))
+    # listings closed before closed_at existed go by their creation date
+    old = Q(closed_at__lt=cutoff) | Q(closed_at__isnull=True, created__lt=cutoff)
+
+    with transaction.atomic():
+        listings = list(Listing.objects.select_for_update(skip_locked=True).filter(old, active=False).order_by("id")[:batch_size])
+        if not listings:
+            return 0
+        ids = [listing.id for listing in listings]
+
+        bids = defaultdict(list)
+        for listing_id, user_id, value, created in Bid.objects.filter(listing__in=ids).order_by("id").values_list("listing_id", "user_id", "value", "created"):
+            bids[listing_id].append([user_id, value, created])
+        comments = defaultdict(list)
+        for listing_id, user_id, comment in Comment.objects.filter(listing__in=ids).order_by("id").values_list("listing_id", "user_id", "comment"):
+            comments[listing_id].append([user_id, comment])
+
+        ArchivedListing.objects.bulk_create([
+            ArchivedListing(
+                id=listing.id,
+                title=listing.title,
+                description=listing.description,
+                value=listing.value,
+                image=listing.image,
+                user_id=listing.user_id,
+                category_id=listing.category_id,
+                winner_id=listing.winner_id,
+                current_price=listing.current_price,
+                bid_count=listing.bid_count,
+                created=listing.created,
+                ends_at=listing.ends_at,
+                closed_at=listing.closed_at,
+                archived_at=now,
+                bids=bids[listing.id],
+                comments=comments[listing.id],
+            )
+            for listing in listings
+        ])
+
+        # bids protect their listing, they go first
+        Bid.objects.filter(listing__in=ids).delete()
+        Comment.objects.filter(listing__in=ids).delete()
+        Watchlist.objects.filter(listing__in=ids).delete()
+        token = archiving.set(True)
+        try:
+            Listing.objects.filter(id__in=ids).delete()
+        finally:
+            archiving.reset(token)
+    return len(listings)
+
+
+# recount the category stats from the listings and the archive, fixing whatever
+# the incremental updates missed. returns how many categories were off
+def reconcile_category_stats(category_ids=None):
+    categories = Category.objects.all()
+    if category_ids is not None:
+        categories = categories.filter(id__in=category_ids)
+    price = Coalesce("current_price", "value")
+
+    with transaction.atomic():
+        expected = {
+            category_id: {"active_listings": 0, "closed_listings": 0, "bids": 0, "min_price": None, "max_price": None}
+            for category_id in categories.values_list("id", flat=True)
+        }
+        listings = Listing.objects.filter(category__in=expected).values("category", "active").annotate(
+            count=Count("id"), bids=Sum("bid_count"), min_price=Min(price), max_price=Max(price)
+        )
+        for row in listings:
+            stats = expected[row["category"]]
+            stats["active_listings" if row["active"] else "closed_listings"] += row["count"]
+            stats["bids"] += row["bids"]
+            if row["active"]:
+                stats["min_price"], stats["max_price"] = row["min_price"], row["max_price"]
+        for row in ArchivedListing.objects.filter(category__in=expected).values("category").annotate(count=Count("id"), bids=Sum("bid_count")):
+            expected[row["category"]]["closed_listings"] += row["count"]
+            expected[row["category"]]["bids"] += row["bids"]
+
+        fixed = 0
+        current = CategoryStats.objects.select_for_update().in_bulk(list(expected))
+        for category_id, values in expected.items():
+            stats = current.get(category_id)
+            if stats is not None and all(getattr(stats, field) == value for field, value in values.items()):
+                continue
+            CategoryStats.objects.update_or_create(category_id=category_id, defaults=values)
+            fixed += 1
+    return fixed
@@ -0,0 +1,110 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, post_migrate, pre_save
+from django.dispatch import receiver
+from .auth import invalidate_user
+from .caching import invalidate_categories, invalidate_listing_card
+from .database import apply_sqlite_pragmas
+from .instrumentation import install_query_recorder
+from .models import Bid, Category, CategoryStats, Comment, Listing, User
+from .pagination import invalidate_listing_count
+from .search import install_sqlite_fts
+from .services import archiving, reconcile_category_stats
+
+
+# the caches are invalidated once the change is committed, invalidated earlier a
+# concurrent request could cache the old row again under the new version
+
+# a listing was added, closed or removed so the active counts are stale
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def listing_changed(sender, instance, using, **kwargs):
+    category_id, listing_id = instance.category_id, instance.id
+
+    def invalidate():
+        invalidate_listing_count(category_id)
+        invalidate_listing_card(listing_id)
+    transaction.on_commit(invalidate, using=using)
+
+
+# bids and comments change what the listing card shows
+@receiver(post_save, sender=Bid)
+@receiver(post_save, sender=Comment)
+def listing_activity(sender, instance, using, **kwargs):
+    listing_id = instance.listing_id
+    transaction.on_commit(lambda: invalidate_listing_card(listing_id), using=using)
+
+
+# categories are cached, make every worker reload them
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, using, **kwargs):
+    transaction.on_commit(invalidate_categories, using=using)
+
+
+@receiver(post_save, sender=Category)
+def category_created(sender, instance, created, **kwargs):
+    if created:
+        CategoryStats.objects.get_or_create(category=instance)
+
+
+# what the category stats of a listing depend on, besides its bids
+def _stats_fields(listing):
+    return (listing.category_id, listing.active, listing.value)
+
+
+# remember the stored values of an edited listing, post_save compares them
+@receiver(pre_save, sender=Listing)
+def listing_saving(sender, instance, raw, **kwargs):
+    if not instance._state.adding and not raw:
+        instance._stats_before = Listing.objects.filter(pk=instance.pk).values_list("category_id", "active", "value").first()
+
+
+# keep the category stats up to date, bids and closing update them themselves
+@receiver(post_save, sender=Listing)
+def listing_saved(sender, instance, created, **kwargs):
+    if created:
+        CategoryStats.listing_added(instance.category_id, instance.current_price or instance.value, instance.active, instance.bid_count)
+        return
+    before = getattr(instance, "_stats_before", None)
+    if before != _stats_fields(instance):
+        # an edit (e.g. in the admin) moved or reopened the listing or changed its
+        # price, recount the categories it left and joined
+        reconcile_category_stats({before[0], instance.category_id} if before else [instance.category_id])
+
+
+@receiver(post_delete, sender=Listing)
+def listing_deleted(sender, instance, **kwargs):
+    # archived listings stay counted through the archive
+    if not archiving.get():
+        CategoryStats.listing_removed(instance.category_id, instance.active, instance.bid_count)
+
+
+# the cached copy of a user (see CachedModelBackend) is dropped whenever the user
+# changes, a password change then logs out the user's other sessions right away
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.id)
+
+
+@receiver(user_logged_out)
+def user_signed_out(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_user(user.id)
+
+
+# the SQLite full text index lives outside the models, (re)create it after migrating
+@receiver(post_migrate)
+def install_search_index(sender, using, **kwargs):
+    if sender.name == "auctions" and connections[using].vendor == "sqlite":
+        install_sqlite_fts(connections[using])
+
+
+# tune every new connection (see AUCTIONS_SQLITE_PRAGMAS) and count and time
+# the queries of every request (see RequestTimingMiddleware)
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    apply_sqlite_pragmas(connection)
+    install_query_recorder(connection)
@@ -0,0 +1,54 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+# optional, without it only gzip copies are written
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# text formats worth compressing, images other than svg are compressed already
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt", ".html", ".xml", ".map")
+
+# keep a compressed copy only if it saves at least this much
+MIN_SAVING = 0.05
+
+
+# ManifestStaticFilesStorage (content hashes in the file names, so they can be
+# cached forever) that also writes name.gz and name.br next to every text file
+# at collectstatic time. StaticFilesMiddleware picks the copy the browser accepts.
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, *args, **kwargs):
+        yield from super().post_process(*args, **kwargs)
+        if kwargs.get("dry_run"):
+            return
+        # the original names are collected too, compress both
+        for name in {*self.hashed_files, *self.hashed_files.values()}:
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as original:
+            content = original.read()
+        # mtime=0 keeps the output the same between runs
+        encoders = {".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            encoders[".br"] = lambda data: brotli.compress(data, quality=11)
+        for suffix, encode in encoders.items():
+            path = self.path(name + suffix)
+            compressed = encode(content)
+            if len(compressed) <= len(content) * (1 - MIN_SAVING):
+                with open(path, "wb") as output:
+                    output.write(compressed)
+            elif self.exists(name + suffix):
+                self.delete(name + suffix)
+
+    # before collectstatic has run (development, tests) there is no manifest, the
+    # plain names are used and served by the staticfiles app as usual
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
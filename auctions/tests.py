@@ -1,6 +1,43 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import re
+import runpy
+import sqlite3
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from better_profanity import profanity
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import OperationalError, connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 from django.core.exceptions import ValidationError
-from .models import Listing, User, Comment, Bid, Category
+from . import api, async_views, views
+from .caching import card_cache_stats, get_categories, render_listing_cards
+from .database import sqlite_pragmas
+from .forms import NewListingForm
+from .instrumentation import view_counters
+from .live import hub, publish_bid
+from .middleware import PRIMARY_COOKIE, PrimaryPinMiddleware, RequestTimingMiddleware
+from .models import ArchivedListing, CategoryStats, Listing, User, Comment, Bid, Category, Watchlist
+from .pagination import COMMENTS_PAGE_SIZE, PAGE_SIZE
+from .profanity import contains_profanity
+from .ratelimit import count_request
+from .routers import PrimaryReplicaRouter, ReadState, read_state
+from .search import search_listings
+from .services import BidError, archive_closed_listings, close_expired_listings, close_listings, place_bid, reconcile_category_stats
 # Decimal is used to represent the value of a bid
 from decimal import Decimal
 
@@ -205,4 +242,1170 @@ class CategoryModelTest(TestCase):
         )
         self.assertEqual(listing.title, "Garden Tools")
         self.assertEqual(listing.category, self.garden_category)
-        self.assertEqual(str(listing.category), f"ID: {self.garden_category.id}: Garden\n")
\ No newline at end of file
+        self.assertEqual(str(listing.category), f"ID: {self.garden_category.id}: Garden\n")
+
+class ListingBidSummaryTest(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='12345')
+        self.alice = User.objects.create_user(username='alice', password='12345')
+        self.bob = User.objects.create_user(username='bob', password='12345')
+        self.category = Category.objects.create(name="Test Category")
+        self.listing = Listing.objects.create(
+            title='Test Listing',
+            description='Test Description',
+            value=Decimal('10.00'),
+            user=self.seller,
+            category=self.category
+        )
+
+    def test_new_listing_has_no_bids(self):
+        self.assertIsNone(self.listing.current_price)
+        self.assertIsNone(self.listing.high_bidder)
+        self.assertEqual(self.listing.bid_count, 0)
+
+    def test_bid_updates_listing_summary(self):
+        Bid.objects.create(value=Decimal('12.00'), user=self.alice, listing=self.listing)
+        Bid.objects.create(value=Decimal('15.00'), user=self.bob, listing=self.listing)
+        # a lower bid is counted but does not take the lead
+        Bid.objects.create(value=Decimal('14.00'), user=self.alice, listing=self.listing)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_price, Decimal('15.00'))
+        self.assertEqual(self.listing.high_bidder, self.bob)
+        self.assertEqual(self.listing.bid_count, 3)
+
+    def test_close_listing_uses_high_bidder(self):
+        Bid.objects.create(value=Decimal('12.00'), user=self.alice, listing=self.listing)
+        self.client.force_login(self.seller)
+        self.client.post(reverse("auctions:close_listing"), {"listing_to_close": self.listing.id})
+        self.listing.refresh_from_db()
+        self.assertFalse(self.listing.active)
+        self.assertEqual(self.listing.winner, self.alice)
+
+
+class ConcurrentBidTest(TransactionTestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user(username='seller', password='12345')
+        self.bidders = [User.objects.create(username=f'bidder{i}') for i in range(8)]
+        self.category = Category.objects.create(name="Test Category")
+        self.listing = Listing.objects.create(
+            title='Hot Listing',
+            description='Everybody wants it',
+            value=Decimal('1.00'),
+            user=self.seller,
+            category=self.category
+        )
+
+    def test_place_bid_rejects_low_bid(self):
+        place_bid(self.listing.id, self.bidders[0], Decimal('5.00'))
+        with self.assertRaises(BidError):
+            place_bid(self.listing.id, self.bidders[1], Decimal('5.00'))
+
+    def test_place_bid_retries_only_locks(self):
+        target = "auctions.services._try_bid"
+        with mock.patch(target, side_effect=OperationalError("disk I/O error")) as attempt:
+            with self.assertRaises(OperationalError):
+                place_bid(self.listing.id, self.bidders[0], Decimal('5.00'))
+        self.assertEqual(attempt.call_count, 1)
+
+        # a lock is not a lost bid, the bidder is not told they were outbid
+        with mock.patch(target, side_effect=[OperationalError("database is locked"), None, "bid"]) as attempt:
+            self.assertEqual(place_bid(self.listing.id, self.bidders[0], Decimal('5.00')), "bid")
+        self.assertEqual([call.kwargs["outbid"] for call in attempt.call_args_list], [False, False, True])
+
+    def test_concurrent_bidders_store_no_invalid_bids(self):
+        barrier = threading.Barrier(len(self.bidders))
+        errors = []
+
+        def bidder(user, offset):
+            barrier.wait()
+            try:
+                # every bidder races for the same price points
+                for step in range(1, 26):
+                    try:
+                        place_bid(self.listing.id, user, Decimal(step) + Decimal(offset) / 100)
+                    except BidError:
+                        pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=bidder, args=(user, i)) for i, user in enumerate(self.bidders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        # every stored bid must beat the one stored before it
+        values = list(Bid.objects.filter(listing=self.listing).order_by("id").values_list("value", flat=True))
+        self.assertTrue(values)
+        self.assertEqual(values, sorted(set(values)))
+        top_bid = Bid.objects.filter(listing=self.listing).order_by("-value").first()
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_price, top_bid.value)
+        self.assertEqual(self.listing.high_bidder, top_bid.user)
+        self.assertEqual(self.listing.bid_count, len(values))
+
+
+class IndexPaginationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='seller')
+        self.category = Category.objects.create(name="Test Category")
+        self.other_category = Category.objects.create(name="Other Category")
+        Listing.objects.bulk_create([
+            Listing(title=f"Listing {i}", description="Description", value=Decimal('1.00'), user=self.user,
+                    category=self.category if i % 2 else self.other_category)
+            for i in range(PAGE_SIZE + 5)
+        ])
+
+    def test_pages_follow_cursor(self):
+        response = self.client.get(reverse("auctions:index"))
+        first_page = response.context["listings"]
+        self.assertEqual(len(first_page), PAGE_SIZE)
+        self.assertEqual(response.context["total"], PAGE_SIZE + 5)
+        next_cursor = response.context["next_cursor"]
+        self.assertEqual(next_cursor, first_page[-1].id)
+
+        response = self.client.get(reverse("auctions:index"), {"after": next_cursor})
+        self.assertEqual(len(response.context["listings"]), 5)
+        self.assertIsNone(response.context["next_cursor"])
+        self.assertTrue(all(listing.id < next_cursor for listing in response.context["listings"]))
+
+    def test_category_page_is_filtered(self):
+        response = self.client.get(reverse("auctions:index_with_category", args=(self.category.id,)))
+        self.assertTrue(all(listing.category_id == self.category.id for listing in response.context["listings"]))
+        self.assertEqual(response.context["total"], Listing.objects.filter(category=self.category).count())
+
+    def test_count_is_cached_and_invalidated(self):
+        self.client.get(reverse("auctions:index"))
+        with self.assertNumQueries(1):
+            self.client.get(reverse("auctions:index"))
+        with self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.create(title="New", description="Description", value=Decimal('1.00'), user=self.user, category=self.category)
+        response = self.client.get(reverse("auctions:index"))
+        self.assertEqual(response.context["total"], PAGE_SIZE + 6)
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN output is SQLite specific")
+class QueryPlanTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='seller')
+        self.category = Category.objects.create(name="Test Category")
+        self.listing = Listing.objects.create(title="Listing", description="Description", value=Decimal('1.00'), user=self.user, category=self.category)
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        # every step that reads a table must go through an index, "SCAN <table>" alone is a full scan
+        for line in plan.splitlines():
+            if " SCAN " in f" {line} " and "USING" not in line:
+                self.fail(f"Full table scan in query plan:\n{plan}")
+        self.assertIn("INDEX", plan)
+
+    def test_index_queries_use_index(self):
+        listings = Listing.objects.filter(active=True)
+        self.assertUsesIndex(listings.order_by("-id")[:PAGE_SIZE + 1])
+        self.assertUsesIndex(listings.filter(id__lt=self.listing.id).order_by("-id")[:PAGE_SIZE + 1])
+        self.assertUsesIndex(listings.filter(category_id=self.category.id).order_by("-id")[:PAGE_SIZE + 1])
+        self.assertUsesIndex(Listing.objects.filter(active=True, category_id=self.category.id).values("id"))
+
+    def test_expired_listings_query_uses_index(self):
+        self.assertUsesIndex(
+            Listing.objects.filter(active=True, ends_at__isnull=False, ends_at__lte=timezone.now()).order_by("ends_at").only("id", "category_id", "high_bidder_id")[:500]
+        )
+
+    def test_top_bid_query_uses_index(self):
+        self.assertUsesIndex(Bid.objects.filter(listing=self.listing).order_by("-value")[:1])
+
+    def test_listing_page_queries_use_index(self):
+        self.assertUsesIndex(Comment.objects.filter(listing=self.listing))
+        self.assertUsesIndex(Watchlist.objects.filter(user=self.user.id, listing=self.listing.id))
+
+    def test_watchlist_query_uses_index(self):
+        self.assertUsesIndex(Watchlist.objects.filter(user=self.user).select_related("listing"))
+
+
+class ProfanityMatcherTest(TestCase):
+
+    def test_same_verdicts_as_better_profanity(self):
+        texts = [
+            "Valid Description",
+            "Fuck the pain away",
+            "sucking on my titis like you wanted me to",
+            "You can not sneak 5h1t is this text",
+            "This is a 5h1tty comment.",
+            "a classic glass of sunshine",
+            "hand_job",
+            "2 girls 1 cup",
+            "sh1t",
+            "  $h!t happens",
+            "x",
+            "",
+        ]
+        for text in texts:
+            with self.subTest(text=text):
+                self.assertEqual(contains_profanity(text), profanity.contains_profanity(text))
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='seller')
+        self.category = Category.objects.create(name="Bikes")
+        self.other_category = Category.objects.create(name="Garden")
+        self.bike = Listing.objects.create(title="Vintage bicycle", description="Steel frame, new tyres", value=Decimal('50.00'), user=self.user, category=self.category)
+        self.frame = Listing.objects.create(title="Picture frame", description="Fits a vintage poster", value=Decimal('5.00'), user=self.user, category=self.other_category)
+        self.closed = Listing.objects.create(title="Vintage lamp", description="Sold already", value=Decimal('5.00'), user=self.user, category=self.other_category, active=False)
+
+    def test_title_matches_rank_first(self):
+        results = list(search_listings("vintage"))
+        self.assertEqual(results, [self.bike, self.frame])
+
+    def test_filters_by_category_and_status(self):
+        self.assertEqual(list(search_listings("vintage", category_id=self.other_category.id)), [self.frame])
+        self.assertEqual(list(search_listings("vintage", active=False)), [self.closed])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.bike.title = "Racing bicycle"
+        self.bike.save()
+        self.assertNotIn(self.bike, search_listings("vintage"))
+        self.assertIn(self.bike, search_listings("racing"))
+        self.frame.delete()
+        self.assertEqual(list(search_listings("poster")), [])
+
+    def test_query_syntax_is_taken_literally(self):
+        self.assertEqual(list(search_listings('"frame* (')), [self.frame, self.bike])
+        self.assertEqual(list(search_listings("   ")), [])
+
+    def test_search_view_paginates(self):
+        response = self.client.get(reverse("auctions:search"), {"q": "vintage", "category": self.category.id})
+        self.assertEqual(list(response.context["page"]), [self.bike])
+
+
+class CategoryCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Electronics")
+        self.user = User.objects.create(username="seller")
+
+    def test_categories_page_reads_categories_with_stats_in_one_query(self):
+        self.client.get(reverse("auctions:categories"))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("auctions:categories"))
+        self.assertEqual(list(response.context["categories"]), [self.category])
+
+    def test_listing_form_renders_and_validates_from_cache(self):
+        get_categories()
+        with self.assertNumQueries(0):
+            html = NewListingForm().as_p()
+            form = NewListingForm({"title": "Phone", "description": "A phone", "starting_bid": "10", "category": self.category.id})
+            self.assertTrue(form.is_valid())
+        self.assertIn("Electronics", html)
+        self.assertEqual(form.cleaned_data["category"], self.category)
+        self.assertFalse(NewListingForm({"title": "Phone", "description": "A phone", "starting_bid": "10", "category": 999}).is_valid())
+
+    def test_saving_a_category_invalidates_the_cache(self):
+        get_categories()
+        with self.captureOnCommitCallbacks(execute=True):
+            garden = Category.objects.create(name="Garden")
+        self.assertIn(garden, get_categories())
+        with self.captureOnCommitCallbacks(execute=True):
+            garden.delete()
+        self.assertEqual(get_categories(), [self.category])
+
+    def test_category_listing_page_uses_cached_name(self):
+        response = self.client.get(reverse("auctions:index_with_category", args=(self.category.id,)))
+        self.assertEqual(response.context["category"], "Electronics")
+
+
+class ListingCardCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        card_cache_stats.reset()
+        self.seller = User.objects.create(username='seller')
+        self.bidder = User.objects.create(username='bidder')
+        self.category = Category.objects.create(name="Test Category")
+        self.listing = Listing.objects.create(title="Lamp", description="Description", value=Decimal('10.00'), user=self.seller, category=self.category)
+
+    def test_cards_are_served_from_cache(self):
+        self.client.get(reverse("auctions:index"))
+        response = self.client.get(reverse("auctions:index"))
+        self.assertContains(response, "Lamp")
+        self.assertEqual((card_cache_stats.hits, card_cache_stats.misses), (1, 1))
+        self.assertEqual(card_cache_stats.hit_ratio, 0.5)
+
+    def test_bid_comment_and_close_invalidate_the_card(self):
+        [(_, card)] = render_listing_cards([self.listing])
+        self.assertIn("10.00", card)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Bid.objects.create(value=Decimal('12.50'), user=self.bidder, listing=self.listing)
+        # until the bid is committed the cached card stays valid
+        [(_, card)] = render_listing_cards([self.listing])
+        self.assertIn("10.00", card)
+        for callback in callbacks:
+            callback()
+        self.listing.refresh_from_db()
+        [(_, card)] = render_listing_cards([self.listing])
+        self.assertIn("12.50", card)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(comment="Nice lamp", user=self.bidder, listing=self.listing)
+            self.listing.title = "Desk lamp"
+            self.listing.save()
+        [(_, card)] = render_listing_cards([self.listing])
+        self.assertIn("Desk lamp", card)
+        self.assertEqual(card_cache_stats.hits, 1)
+
+    def test_row_read_before_a_bid_does_not_replace_the_new_card(self):
+        # a page loaded its rows, then a bid was committed before the cards were rendered
+        stale = Listing.objects.get(pk=self.listing.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Bid.objects.create(value=Decimal('12.50'), user=self.bidder, listing=self.listing)
+        [(_, card)] = render_listing_cards([stale])
+        self.assertIn("10.00", card)
+
+        self.listing.refresh_from_db()
+        [(_, card)] = render_listing_cards([self.listing])
+        self.assertIn("12.50", card)
+
+
+class WatchlistViewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create(username='seller')
+        self.user = User.objects.create(username='watcher')
+        self.category = Category.objects.create(name="Test Category")
+        listings = Listing.objects.bulk_create([
+            Listing(title=f"Listing {i}", description="Description", value=Decimal('1.00'), user=self.seller, category=self.category)
+            for i in range(500)
+        ])
+        Watchlist.objects.bulk_create([Watchlist(user=self.user, listing=listing) for listing in listings])
+        self.newest = listings[-1]
+        Bid.objects.create(value=Decimal('2.00'), user=self.user, listing=self.newest)
+        self.client.force_login(self.user)
+
+    def test_query_count_does_not_grow_with_watchlist(self):
+        # user (the session is cached) and one page of watchlist items joined with their listings
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("auctions:watchlist"))
+        self.assertEqual(len(response.context["cards"]), PAGE_SIZE)
+        self.assertEqual(response.context["winning"], {self.newest.id})
+
+        # the user is cached now too
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("auctions:watchlist"), {"after": response.context["next_cursor"]})
+        self.assertEqual(len(response.context["cards"]), PAGE_SIZE)
+
+    def test_concurrent_adds_both_succeed(self):
+        listing = Listing.objects.create(title="Lamp", description="Description", value=Decimal('1.00'), user=self.seller, category=self.category)
+        Watchlist.objects.create(user=self.user, listing=listing)
+        # the other request added the listing after this one found nothing to remove
+        with mock.patch("django.db.models.query.QuerySet.delete", return_value=(0, {})):
+            response = self.client.post(reverse("auctions:watchlist_listing", args=(listing.id,)))
+        self.assertEqual(response.json()["type"], "ADD")
+        self.assertEqual(Watchlist.objects.filter(user=self.user, listing=listing).count(), 1)
+
+
+class ListingCommentsTest(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create(username='seller')
+        self.category = Category.objects.create(name="Test Category")
+        self.listing = Listing.objects.create(title="Lamp", description="Description", value=Decimal('10.00'), user=self.seller, category=self.category)
+        users = User.objects.bulk_create([User(username=f'commenter{i}') for i in range(50)])
+        Comment.objects.bulk_create([Comment(comment=f"Comment {i}", user=user, listing=self.listing) for i, user in enumerate(users)])
+
+    def test_listing_page_renders_newest_comments_with_fixed_queries(self):
+        # listing, comments page with their users, watching, listing user and category
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse("auctions:listing", args=(self.listing.id,)))
+        comments = response.context["comments"]
+        self.assertEqual(len(comments), COMMENTS_PAGE_SIZE)
+        self.assertEqual(comments[0].comment, "Comment 49")
+        self.assertContains(response, "Load older comments")
+
+    def test_older_comments_endpoint_follows_cursor(self):
+        url = reverse("auctions:listing_comments", args=(self.listing.id,))
+        seen = []
+        cursor = None
+        while True:
+            data = self.client.get(url, {"after": cursor} if cursor else {}).json()
+            seen += [comment["comment"] for comment in data["comments"]]
+            cursor = data["next"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f"Comment {i}" for i in reversed(range(50))])
+
+    def test_older_comments_of_unknown_or_archived_listing_is_404(self):
+        self.assertEqual(self.client.get(reverse("auctions:listing_comments", args=(self.listing.id + 1,))).status_code, 404)
+        close_listings([self.listing], now=timezone.now() - timedelta(days=settings.AUCTIONS_ARCHIVE_AFTER_DAYS + 1))
+        archive_closed_listings()
+        self.assertEqual(self.client.get(reverse("auctions:listing_comments", args=(self.listing.id,))).status_code, 404)
+
+
+class ListingEventsTest(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create(username='seller')
+        self.bidder = User.objects.create(username='bidder')
+        self.category = Category.objects.create(name="Test Category")
+        self.listing = Listing.objects.create(title="Lamp", description="Description", value=Decimal('10.00'), user=self.seller, category=self.category)
+
+    async def test_hub_delivers_events_published_from_other_threads(self):
+        subscription = hub.subscribe(self.listing.id)
+        try:
+            # views publish from worker threads
+            thread = threading.Thread(target=hub.publish, args=(self.listing.id, "close", {"winner": None}))
+            thread.start()
+            message = await asyncio.wait_for(subscription.queue.get(), 1)
+            thread.join()
+        finally:
+            hub.unsubscribe(self.listing.id, subscription)
+        self.assertEqual(message, 'event: close\ndata: {"winner": null}\n\n')
+        self.assertEqual(hub.subscriber_count(self.listing.id), 0)
+
+    async def test_event_stream_sends_new_high_bids(self):
+        response = await self.async_client.get(reverse("auctions:listing_events", args=(self.listing.id,)))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+
+        bid = Bid(value=Decimal("12.00"), user=self.bidder, listing=self.listing)
+        publish_bid(bid)
+        message = await asyncio.wait_for(anext(stream), 1)
+        self.assertTrue(message.startswith(b"event: bid\n"))
+        self.assertIn(b'"price": "12.00"', message)
+        await stream.aclose()
+
+    def test_no_event_stream_under_wsgi(self):
+        # under WSGI the stream would never start and hold a worker thread
+        self.assertEqual(self.client.get(reverse("auctions:listing_events", args=(self.listing.id,))).status_code, 204)
+        self.assertNotContains(self.client.get(reverse("auctions:listing", args=(self.listing.id,))), "EventSource")
+
+    async def test_listing_page_opens_event_stream_under_asgi(self):
+        response = await self.async_client.get(reverse("auctions:listing", args=(self.listing.id,)))
+        self.assertContains(response, "EventSource")
+
+
+class AsyncViewsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create(username='seller')
+        self.user = User.objects.create(username='watcher')
+        self.category = Category.objects.create(name="Test Category")
+        self.listing = Listing.objects.create(title="Lamp", description="Description", value=Decimal('10.00'), user=self.seller, category=self.category)
+        Comment.objects.create(comment="Nice lamp", user=self.user, listing=self.listing)
+        Watchlist.objects.create(user=self.user, listing=self.listing)
+        self.factory = RequestFactory()
+        self.async_factory = AsyncRequestFactory()
+
+    # an async request as the auth middleware would leave it
+    def async_request(self, path, user=None):
+        user = user or AnonymousUser()
+        request = self.async_factory.get(path)
+        request.user = user
+
+        async def auser():
+            return user
+
+        request.auser = auser
+        return request
+
+    # the same request for the sync views
+    def sync_request(self, path, user=None):
+        request = self.factory.get(path)
+        request.user = user or AnonymousUser()
+        return request
+
+    async def test_index_and_categories_match_sync_views(self):
+        for sync_view, async_view, args in (
+            (views.index, async_views.index, ()),
+            (views.index, async_views.index, (self.category.id,)),
+            (views.categories, async_views.categories, ()),
+        ):
+            with self.subTest(view=async_view.__name__, args=args):
+                expected = await sync_to_async(sync_view)(self.sync_request("/"), *args)
+                response = await async_view(self.async_request("/"), *args)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+
+    async def test_listing_and_watchlist(self):
+        response = await async_views.listing(self.async_request("/"), self.listing.id)
+        self.assertContains(response, "Nice lamp")
+        self.assertContains(response, "Lamp")
+
+        response = await async_views.watchlist(self.async_request("/watchlist", self.user))
+        self.assertContains(response, "Lamp")
+        response = await async_views.watchlist(self.async_request("/watchlist"))
+        self.assertEqual(response.status_code, 302)
+
+
+class TimedAuctionTest(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create(username='seller')
+        self.bidder = User.objects.create(username='bidder')
+        self.category = Category.objects.create(name="Test Category")
+        now = timezone.now()
+        self.expired = Listing.objects.bulk_create([
+            Listing(title=f"Expired {i}", description="Description", value=Decimal('1.00'), user=self.seller, category=self.category, ends_at=now - timedelta(minutes=i + 1))
+            for i in range(5)
+        ])
+        self.running = Listing.objects.create(title="Running", description="Description", value=Decimal('1.00'), user=self.seller, category=self.category, ends_at=now + timedelta(hours=1))
+        self.untimed = Listing.objects.create(title="Untimed", description="Description", value=Decimal('1.00'), user=self.seller, category=self.category)
+        Bid.objects.create(value=Decimal('3.00'), user=self.bidder, listing=self.expired[0])
+
+    def test_command_closes_expired_listings_in_batches(self):
+        call_command("close_expired_listings", batch_size=2, stdout=StringIO())
+        for listing in self.expired:
+            listing.refresh_from_db()
+            self.assertFalse(listing.active)
+            self.assertIsNotNone(listing.closed_at)
+        self.assertEqual(self.expired[0].winner, self.bidder)
+        self.assertIsNone(self.expired[1].winner)
+        self.assertTrue(Listing.objects.get(pk=self.running.pk).active)
+        self.assertTrue(Listing.objects.get(pk=self.untimed.pk).active)
+
+    def test_closing_twice_closes_nothing(self):
+        self.assertEqual(close_expired_listings(), 5)
+        self.assertEqual(close_expired_listings(), 0)
+
+    @mock.patch("auctions.services.publish_close")
+    def test_only_listings_closed_now_are_announced(self, publish_close):
+        with self.captureOnCommitCallbacks(execute=True):
+            close_listings(self.expired[:2])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(close_listings(self.expired[1:3]), 1)
+        self.assertEqual(
+            [call.args for call in publish_close.call_args_list],
+            [(self.expired[0].id, self.bidder.id), (self.expired[1].id, None), (self.expired[2].id, None)],
+        )
+
+    def test_bids_after_the_end_are_rejected(self):
+        with self.assertRaises(BidError):
+            place_bid(self.expired[1].id, self.bidder, Decimal('5.00'))
+
+    @mock.patch("auctions.management.commands.close_expired_listings.time.sleep")
+    def test_command_only_retries_a_locked_database_for_a_while(self, sleep):
+        target = "auctions.management.commands.close_expired_listings.close_expired_listings"
+        with mock.patch(target, side_effect=[OperationalError("database is locked"), 5, 0]):
+            call_command("close_expired_listings", stdout=StringIO())
+        with mock.patch(target, side_effect=OperationalError("no such table: auctions_listing")) as close:
+            with self.assertRaises(OperationalError):
+                call_command("close_expired_listings", stdout=StringIO())
+        self.assertEqual(close.call_count, 1)
+        with mock.patch(target, side_effect=OperationalError("database is locked")) as close:
+            with self.assertRaises(OperationalError):
+                call_command("close_expired_listings", stdout=StringIO())
+        self.assertEqual(close.call_count, 50)
+
+
+class ImportListingsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create(username='seller')
+        self.category = Category.objects.create(name="Garden")
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def import_file(self, name, content, workers=0):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as source:
+            source.write(content)
+        call_command("import_listings", path, workers=workers, chunk_size=2, stdout=StringIO())
+        with open(f"{path}.rejects.jsonl") as rejects:
+            return [json.loads(line) for line in rejects]
+
+    def test_csv_import_rejects_invalid_rows(self):
+        rejects = self.import_file("listings.csv", (
+            "title,description,starting_bid,category,user\n"
+            "Spade,Sturdy spade,10.00,Garden,seller\n"
+            "Rake,Shitty rake,5.00,Garden,seller\n"
+            "Hose,Long hose,-1,Garden,seller\n"
+            "Shears,Sharp shears,8.00,Kitchen,seller\n"
+            "Trowel,Small trowel,3.00,Garden,nobody\n"
+            "Gloves,Leather gloves,4.00,Garden,seller\n"
+        ))
+        self.assertEqual(sorted(Listing.objects.values_list("title", flat=True)), ["Gloves", "Spade"])
+        self.assertEqual([reject["line"] for reject in rejects], [3, 4, 5, 6])
+        self.assertIn("description", rejects[0]["errors"])
+        self.assertIn("value", rejects[1]["errors"])
+        self.assertIn("category", rejects[2]["errors"])
+        self.assertIn("user", rejects[3]["errors"])
+
+    def test_jsonl_import_in_worker_processes(self):
+        rejects = self.import_file("listings.jsonl", (
+            '{"title": "Spade", "description": "Sturdy spade", "starting_bid": "10.00", "category": "Garden", "user": "seller"}\n'
+            'not json\n'
+            '{"title": "Rake", "description": "Wooden rake", "starting_bid": 5, "category": "Garden", "user": "seller"}\n'
+        ), workers=2)
+        self.assertEqual(sorted(Listing.objects.values_list("title", flat=True)), ["Rake", "Spade"])
+        self.assertEqual([reject["line"] for reject in rejects], [2])
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create(username='staff', is_staff=True)
+        self.seller = User.objects.create(username='seller')
+        self.garden = Category.objects.create(name="Garden")
+        self.kitchen = Category.objects.create(name="Kitchen")
+        self.spade = Listing.objects.create(title="Spade", description="Sturdy spade", value=Decimal('10.00'), user=self.seller, category=self.garden)
+        self.pan = Listing.objects.create(title="Pan", description="Frying pan", value=Decimal('5.00'), user=self.seller, category=self.kitchen, active=False)
+        self.old = Listing.objects.create(title="Old rake", description="Wooden rake", value=Decimal('2.00'), user=self.seller, category=self.garden, created=timezone.now() - timedelta(days=30))
+        Bid.objects.create(value=Decimal('12.00'), user=self.staff, listing=self.spade)
+        Watchlist.objects.create(user=self.staff, listing=self.pan)
+
+    def export(self, kind, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("auctions:export", args=(kind,)), params)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_export_is_filtered(self):
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        lines = self.export("listings", since=since, category=self.garden.id, active="true").splitlines()
+        self.assertEqual(lines[0].split(",")[:4], ["id", "title", "description", "category"])
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f"{self.spade.id},Spade,Sturdy spade,Garden,seller,10.00,12.00,1,staff,"))
+
+    def test_jsonl_export_of_bids_and_watchlists(self):
+        bids = [json.loads(line) for line in self.export("bids", format="jsonl").splitlines()]
+        self.assertEqual([(bid["listing"], bid["bidder"], bid["value"]) for bid in bids], [("Spade", "staff", "12.00")])
+        watchlists = [json.loads(line) for line in self.export("watchlists", format="jsonl", active="false").splitlines()]
+        self.assertEqual([(item["user"], item["listing"]) for item in watchlists], [("staff", "Pan")])
+
+    def test_export_is_for_staff_only(self):
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse("auctions:export", args=("listings",)))
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("auctions:export", args=("listings",)), {"since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_writes_the_export(self):
+        out = StringIO()
+        call_command("export_data", "listings", active="false", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+        self.assertIn("Pan", out.getvalue())
+
+
+class ListingApiTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='user')
+        self.seller = User.objects.create(username='seller')
+        self.category = Category.objects.create(name="Garden")
+        self.listings = Listing.objects.bulk_create([
+            Listing(title=f"Listing {i}", description="Description", value=Decimal('2.00'), user=self.seller, category=self.category)
+            for i in range(30)
+        ])
+        Bid.objects.create(value=Decimal('5.00'), user=self.user, listing=self.listings[0])
+        Watchlist.objects.create(user=self.user, listing=self.listings[1])
+
+    def test_batch_in_a_fixed_number_of_queries(self):
+        self.client.force_login(self.user)
+        ids = [listing.id for listing in self.listings[:3]]
+        url = reverse("auctions:api_listings") + "?ids=" + ",".join(map(str, reversed(ids)))
+        # user (the session is cached), listings, watch status
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        data = response.json()["listings"]
+        self.assertEqual([listing["id"] for listing in data], ids[::-1])
+        self.assertEqual([listing["price"] for listing in data], ["2.00", "2.00", "5.00"])
+        self.assertEqual([listing["watching"] for listing in data], [False, True, False])
+        ids = [listing.id for listing in self.listings]
+        # listings and watch status, the user is cached by now
+        with self.assertNumQueries(2):
+            self.client.get(reverse("auctions:api_listings"), {"ids": ",".join(map(str, ids))})
+
+    @skipUnless(api.orjson, "orjson is not installed")
+    def test_orjson_and_json_write_the_same(self):
+        data = {"price": Decimal('2.50'), "created": timezone.now().replace(microsecond=123456), "day": timezone.now().date()}
+        with mock.patch("auctions.api.orjson", None):
+            expected = json.loads(api.dumps(data))
+        self.assertEqual(json.loads(api.dumps(data)), expected)
+        self.assertTrue(expected["created"].endswith(".123Z"))
+
+    def test_fields_trim_the_payload(self):
+        listing = self.listings[0]
+        response = self.client.get(reverse("auctions:api_listing", args=(listing.id,)), {"fields": "title,bid_count,seller"})
+        self.assertEqual(response.json(), {"title": listing.title, "bid_count": 1, "seller": "seller"})
+        response = self.client.get(reverse("auctions:api_listing", args=(listing.id,)), {"fields": "title,secret"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_pages_of_active_listings(self):
+        first = self.client.get(reverse("auctions:api_listings"), {"fields": "id"}).json()
+        self.assertEqual(len(first["listings"]), PAGE_SIZE)
+        second = self.client.get(reverse("auctions:api_listings"), {"fields": "id", "after": first["next"]}).json()
+        self.assertEqual(len(first["listings"]) + len(second["listings"]), 30)
+        self.assertIsNone(second["next"])
+
+
+class BenchmarkCommandsTest(TestCase):
+
+    def test_seed_and_benchmark(self):
+        call_command("seed_benchmark", users=20, listings=50, bids=400, comments=100, watchlists=100, batch_size=20, stdout=StringIO())
+        self.assertEqual(Listing.objects.count(), 50)
+        # the stored bid summary matches the seeded bids
+        for listing in Listing.objects.filter(bid_count__gt=0)[:10]:
+            bids = listing.listing_bids.order_by("-value")
+            self.assertEqual(bids.count(), listing.bid_count)
+            self.assertEqual((bids[0].value, bids[0].user_id), (listing.current_price, listing.high_bidder_id))
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "results.json")
+        call_command("bench_views", requests=2, warmup=0, output=path, stdout=StringIO(), stderr=StringIO())
+        with open(path) as results:
+            results = json.load(results)["results"]
+        self.assertEqual(results["index"]["status"], 200)
+        self.assertEqual(results["listing (bid)"]["status"], 302)
+        self.assertIn("queries", results["watchlist"])
+
+
+class RequestTimingTest(TestCase):
+
+    def setUp(self):
+        view_counters.reset()
+        self.user = User.objects.create(username='user', is_staff=True)
+        self.category = Category.objects.create(name="Test Category")
+        self.listing = Listing.objects.create(title="Listing", description="Description", value=Decimal('1.00'), user=self.user, category=self.category)
+
+    def test_server_timing_header_and_view_counters(self):
+        response = self.client.get(reverse("auctions:listing", args=(self.listing.id,)))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'^sql;dur=[\d.]+;desc="\d+ queries", render;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertGreater(float(re.search(r"render;dur=([\d.]+)", timing).group(1)), 0)
+
+        self.client.get(reverse("auctions:listing", args=(self.listing.id,)))
+        self.client.force_login(self.user)
+        stats = self.client.get(reverse("auctions:view_stats")).json()["views"]
+        self.assertEqual(stats["auctions:listing"]["requests"], 2)
+        self.assertGreater(stats["auctions:listing"]["avg_queries"], 0)
+
+    def test_repeated_queries_are_logged(self):
+        def n_plus_one(request):
+            for listing in Listing.objects.all():
+                listing.user
+            return HttpResponse()
+
+        Listing.objects.bulk_create([
+            Listing(title=f"Listing {i}", description="Description", value=Decimal('1.00'), user=self.user, category=self.category)
+            for i in range(5)
+        ])
+        request = RequestFactory().get("/")
+        request.resolver_match = None
+        with self.settings(AUCTIONS_SLOW_DUPLICATE_QUERIES=5), self.assertLogs("auctions.performance", "WARNING") as logs:
+            response = RequestTimingMiddleware(n_plus_one)(request)
+        self.assertIn('7 queries', response["Server-Timing"])
+        self.assertIn('6x SELECT "auctions_user"', logs.output[0])
+        self.assertEqual(view_counters.snapshot()["<unresolved>"]["slow"], 1)
+
+
+class DatabaseProfileTest(TestCase):
+
+    def production_settings(self):
+        with mock.patch.dict(os.environ, {"AUCTIONS_DB_PROFILE": "production"}):
+            return runpy.run_path(os.path.join(settings.BASE_DIR, "commerce", "settings.py"))
+
+    def test_production_profile_keeps_connections(self):
+        database = self.production_settings()["DATABASES"]["default"]
+        self.assertEqual(database["CONN_MAX_AGE"], 600)
+        self.assertTrue(database["CONN_HEALTH_CHECKS"])
+        self.assertEqual(database["OPTIONS"]["transaction_mode"], "IMMEDIATE")
+
+    def test_pragmas_are_set_on_new_connections(self):
+        pragmas = self.production_settings()["AUCTIONS_SQLITE_PRAGMAS"]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = type(connections["default"])({**connection.settings_dict, "NAME": os.path.join(directory.name, "db.sqlite3")}, alias="profile_test")
+        self.addCleanup(wrapper.close)
+        with self.settings(AUCTIONS_SQLITE_PRAGMAS=pragmas):
+            # connecting sends connection_created
+            wrapper.ensure_connection()
+            values = sqlite_pragmas(wrapper)
+        self.assertEqual(values["journal_mode"], "wal")
+        self.assertEqual(values["busy_timeout"], 5000)
+        # NORMAL
+        self.assertEqual(values["synchronous"], 1)
+        self.assertEqual(values["cache_size"], -64 * 1024)
+
+
+@override_settings(AUCTIONS_READ_REPLICAS=["replica1", "replica2"])
+class PrimaryReplicaRouterTest(TestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        # TestCase runs every test in a transaction, which keeps reads on the primary
+        patcher = mock.patch.object(connections["default"], "in_atomic_block", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(read_state.reset, read_state.set(ReadState()))
+
+    def test_reads_go_to_replicas_until_a_write(self):
+        self.assertIn(self.router.db_for_read(Listing), ["replica1", "replica2"])
+        self.assertEqual(self.router.db_for_write(Bid), "default")
+        self.assertEqual(self.router.db_for_read(Listing), "default")
+        self.assertTrue(read_state.get().wrote)
+
+    def test_a_request_reads_from_one_replica(self):
+        replicas = {self.router.db_for_read(Listing) for _ in range(20)}
+        self.assertEqual(len(replicas), 1)
+
+    def test_reads_in_a_transaction_go_to_the_primary(self):
+        connections["default"].in_atomic_block = True
+        self.assertEqual(self.router.db_for_read(Listing), "default")
+
+    @override_settings(AUCTIONS_READ_REPLICAS=[])
+    def test_without_replicas_everything_uses_default(self):
+        self.assertIsNone(self.router.db_for_read(Listing))
+        self.assertEqual(self.router.db_for_write(Listing), "default")
+        self.assertFalse(read_state.get().wrote)
+
+
+@override_settings(AUCTIONS_READ_REPLICAS=["replica1"])
+class PrimaryPinMiddlewareTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='user')
+        self.category = Category.objects.create(name="Test Category")
+        self.listing = Listing.objects.create(title="Listing", description="Description", value=Decimal('1.00'), user=self.user, category=self.category)
+        self.client.force_login(self.user)
+
+    def test_a_write_pins_the_user_to_the_primary(self):
+        response = self.client.get(reverse("auctions:listing", args=(self.listing.id,)))
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+        response = self.client.post(reverse("auctions:listing", args=(self.listing.id,)), {"submit_comment": "", "comment": "Nice"})
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]["max-age"], settings.AUCTIONS_PRIMARY_STICKY_SECONDS)
+
+    def test_pinned_requests_read_from_the_primary(self):
+        seen = []
+
+        def view(request):
+            seen.append(PrimaryReplicaRouter().db_for_read(Listing))
+            return HttpResponse()
+
+        middleware = PrimaryPinMiddleware(view)
+        pinned = RequestFactory().get("/")
+        pinned.COOKIES[PRIMARY_COOKIE] = "1"
+        with mock.patch.object(connections["default"], "in_atomic_block", False):
+            middleware(RequestFactory().get("/"))
+            middleware(pinned)
+        self.assertEqual(seen, ["replica1", "default"])
+
+
+# the primary and a replica as two SQLite databases: the replica is a copy of the
+# primary taken in setUp, the primary is then changed so the replica lags behind
+class ReplicaDatabaseTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='seller')
+        self.category = Category.objects.create(name="Test Category")
+        self.listing = Listing.objects.create(title="Lamp", description="Description", value=Decimal('1.00'), user=self.user, category=self.category)
+
+        # the replica starts as a copy of the primary
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        name = os.path.join(directory.name, "replica.sqlite3")
+        connection.ensure_connection()
+        replica = sqlite3.connect(name)
+        connection.connection.backup(replica)
+        replica.close()
+
+        # a connection of its own, not one from DATABASES the test runner would set up
+        primary = connections["default"]
+        connections["replica"] = primary.__class__({**primary.settings_dict, "NAME": name}, "replica")
+        self.addCleanup(connections.__delitem__, "replica")
+        self.addCleanup(lambda: connections["replica"].close())
+        replicas = override_settings(AUCTIONS_READ_REPLICAS=["replica"])
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+        self.addCleanup(read_state.reset, read_state.set(None))
+
+        # not replicated yet
+        Listing.objects.using("default").filter(pk=self.listing.pk).update(title="Desk lamp")
+
+    def test_anonymous_reads_come_from_the_replica(self):
+        response = self.client.get(reverse("auctions:index"))
+        self.assertContains(response, "Lamp")
+        self.assertNotContains(response, "Desk lamp")
+
+    def test_pinned_reads_come_from_the_primary(self):
+        self.client.cookies[PRIMARY_COOKIE] = "1"
+        response = self.client.get(reverse("auctions:index"))
+        self.assertContains(response, "Desk lamp")
+
+    def test_reads_after_a_write_come_from_the_primary(self):
+        titles = []
+
+        def view(request):
+            titles.append(Listing.objects.get(pk=self.listing.pk).title)
+            Watchlist.objects.create(user=self.user, listing=self.listing)
+            titles.append(Listing.objects.get(pk=self.listing.pk).title)
+            return HttpResponse()
+
+        response = PrimaryPinMiddleware(view)(RequestFactory().get("/"))
+        self.assertEqual(titles, ["Lamp", "Desk lamp"])
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+
+class ArchiveTest(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create(username='seller')
+        self.bidder = User.objects.create(username='bidder')
+        self.category = Category.objects.create(name="Test Category")
+        long_ago = timezone.now() - timedelta(days=settings.AUCTIONS_ARCHIVE_AFTER_DAYS + 1)
+        self.old = Listing.objects.create(title="Old", description="Description", value=Decimal('1.00'), user=self.seller, category=self.category)
+        Bid.objects.create(value=Decimal('2.00'), user=self.bidder, listing=self.old)
+        Bid.objects.create(value=Decimal('3.00'), user=self.bidder, listing=self.old)
+        Comment.objects.create(comment="Nice", user=self.bidder, listing=self.old)
+        Watchlist.objects.create(user=self.bidder, listing=self.old)
+        close_listings([Listing.objects.get(pk=self.old.pk)], now=long_ago)
+        self.recent = Listing.objects.create(title="Recent", description="Description", value=Decimal('1.00'), user=self.seller, category=self.category)
+        close_listings([self.recent])
+        self.running = Listing.objects.create(title="Running", description="Description", value=Decimal('1.00'), user=self.seller, category=self.category)
+
+    def test_old_closed_listings_are_archived(self):
+        call_command("archive_listings", batch_size=1, stdout=StringIO())
+        self.assertEqual(list(Listing.objects.order_by("id").values_list("title", flat=True)), ["Recent", "Running"])
+        self.assertFalse(Bid.objects.filter(listing=self.old.id).exists())
+        self.assertFalse(Watchlist.objects.exists())
+        archived = ArchivedListing.objects.get(pk=self.old.id)
+        self.assertEqual((archived.winner, archived.current_price, archived.bid_count), (self.bidder, Decimal('3.00'), 2))
+        self.assertEqual([bid[:2] for bid in archived.bids], [[self.bidder.id, "2.00"], [self.bidder.id, "3.00"]])
+        self.assertEqual(archived.comments, [[self.bidder.id, "Nice"]])
+
+    @mock.patch("auctions.management.commands.archive_listings.time.sleep")
+    def test_command_only_retries_a_locked_database_for_a_while(self, sleep):
+        target = "auctions.management.commands.archive_listings.archive_closed_listings"
+        with mock.patch(target, side_effect=OperationalError("disk I/O error")) as archive:
+            with self.assertRaises(OperationalError):
+                call_command("archive_listings", stdout=StringIO())
+        self.assertEqual(archive.call_count, 1)
+        with mock.patch(target, side_effect=OperationalError("database is locked")) as archive:
+            with self.assertRaises(OperationalError):
+                call_command("archive_listings", stdout=StringIO())
+        self.assertEqual(archive.call_count, 50)
+
+    def test_archived_listing_is_shown_read_only(self):
+        archive_closed_listings()
+        self.client.force_login(self.bidder)
+        response = self.client.get(reverse("auctions:listing", args=(self.old.id,)))
+        self.assertContains(response, "This listing has been archived.")
+        self.assertContains(response, "Congratulations, you WON!")
+        self.assertNotContains(response, "submit_bid")
+        self.assertEqual(self.client.get(reverse("auctions:listing", args=(self.running.id + 1,))).status_code, 404)
+
+
+class CategoryStatsTest(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create(username='seller')
+        self.bidder = User.objects.create(username='bidder')
+        self.category = Category.objects.create(name="Test Category")
+        self.cheap = Listing.objects.create(title="Cheap", description="Description", value=Decimal('1.00'), user=self.seller, category=self.category)
+        self.dear = Listing.objects.create(title="Dear", description="Description", value=Decimal('5.00'), user=self.seller, category=self.category)
+
+    def stats(self):
+        stats = CategoryStats.objects.get(category=self.category)
+        return (stats.active_listings, stats.closed_listings, stats.bids, stats.min_price, stats.max_price)
+
+    def test_listings_and_bids_update_the_stats(self):
+        self.assertEqual(self.stats(), (2, 0, 0, Decimal('1.00'), Decimal('5.00')))
+        place_bid(self.cheap.id, self.bidder, Decimal('2.00'))
+        self.assertEqual(self.stats(), (2, 0, 1, Decimal('2.00'), Decimal('5.00')))
+        place_bid(self.cheap.id, self.bidder, Decimal('7.00'))
+        self.assertEqual(self.stats(), (2, 0, 2, Decimal('5.00'), Decimal('7.00')))
+        self.assertEqual(reconcile_category_stats(), 0)
+
+    def test_closing_and_archiving_update_the_stats(self):
+        close_listings([self.dear])
+        self.assertEqual(self.stats(), (1, 1, 0, Decimal('1.00'), Decimal('1.00')))
+        Listing.objects.filter(pk=self.cheap.pk).update(ends_at=timezone.now() - timedelta(minutes=1))
+        close_expired_listings()
+        self.assertEqual(self.stats(), (0, 2, 0, None, None))
+        archive_closed_listings(older_than=timedelta(0))
+        self.assertEqual(self.stats(), (0, 2, 0, None, None))
+        self.assertEqual(reconcile_category_stats(), 0)
+
+    def test_edits_only_recount_when_the_stats_change(self):
+        self.cheap.title = "Still cheap"
+        with mock.patch("auctions.signals.reconcile_category_stats") as reconcile:
+            self.cheap.save()
+        reconcile.assert_not_called()
+
+        other = Category.objects.create(name="Other Category")
+        self.dear.category = other
+        self.dear.save()
+        self.assertEqual(self.stats(), (1, 0, 0, Decimal('1.00'), Decimal('1.00')))
+        self.assertEqual(CategoryStats.objects.get(category=other).max_price, Decimal('5.00'))
+        self.assertEqual(reconcile_category_stats(), 0)
+
+    def test_deleting_listings_updates_the_stats(self):
+        place_bid(self.dear.id, self.bidder, Decimal('6.00'))
+        close_listings([self.dear])
+        Bid.objects.filter(listing=self.dear).delete()
+        Listing.objects.get(pk=self.dear.pk).delete()
+        Listing.objects.get(pk=self.cheap.pk).delete()
+        self.assertEqual(self.stats(), (0, 0, 0, None, None))
+        self.assertEqual(reconcile_category_stats(), 0)
+
+    def test_reconcile_command_fixes_drift(self):
+        CategoryStats.objects.filter(category=self.category).update(active_listings=9, max_price=Decimal('99.00'))
+        out = StringIO()
+        call_command("reconcile_category_stats", stdout=out)
+        self.assertIn("fixed 1 categories", out.getvalue())
+        self.assertEqual(self.stats(), (2, 0, 0, Decimal('1.00'), Decimal('5.00')))
+
+    def test_categories_page_shows_the_stats(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("auctions:categories"))
+        self.assertContains(response, "2 active listings, $1.00 to $5.00")
+
+
+class CachedAuthTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='secret-password')
+        self.seller = User.objects.create(username='seller')
+        self.category = Category.objects.create(name="Test Category")
+        self.listing = Listing.objects.create(title="Listing", description="Description", value=Decimal('1.00'), user=self.seller, category=self.category)
+        self.client.login(username='user', password='secret-password')
+
+    def test_session_and_user_come_from_the_cache(self):
+        self.client.get(reverse("auctions:watchlist"))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("auctions:watchlist"))
+        self.assertEqual(response.context["user"], self.user)
+        tables = " ".join(query["sql"] for query in context)
+        self.assertNotIn("django_session", tables)
+        self.assertNotIn("auctions_user", tables)
+
+    def test_password_change_logs_out_other_sessions(self):
+        self.client.get(reverse("auctions:watchlist"))
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password('another-password')
+        user.save()
+        self.assertEqual(self.client.get(reverse("auctions:watchlist")).status_code, 302)
+
+    def test_logout_drops_the_cached_user(self):
+        self.client.get(reverse("auctions:watchlist"))
+        self.assertIsNotNone(cache.get(f"user:{self.user.id}"))
+        self.client.get(reverse("auctions:logout"))
+        self.assertIsNone(cache.get(f"user:{self.user.id}"))
+
+    def test_watch_listing_does_not_load_the_user_again(self):
+        url = reverse("auctions:watchlist_listing", args=(self.listing.id,))
+        self.client.get(reverse("auctions:watchlist"))
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.post(url).json()["type"], "ADD")
+        self.assertNotIn("auctions_user", " ".join(query["sql"] for query in context))
+        self.assertEqual(self.client.post(url).json()["type"], "REMOVE")
+        self.assertFalse(Watchlist.objects.exists())
+
+
+class StaticFilesTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        settings_override = override_settings(STATIC_ROOT=directory.name, DEBUG=False)
+        settings_override.enable()
+        cls.addClassCleanup(settings_override.disable)
+        # brotli at its best quality is slow on the admin's files, the gzip copies are enough here
+        with mock.patch("auctions.staticfiles.brotli", None):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+    def setUp(self):
+        self.url = re.search(r'href="(/static/auctions/styles\.\w+\.css)"', self.client.get(reverse("auctions:index")).content.decode()).group(1)
+
+    def test_hashed_files_are_cached_for_good(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(response.content, open(os.path.join(settings.BASE_DIR, "auctions/static/auctions/styles.css"), "rb").read())
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get("/static/auctions/styles.css")["Cache-Control"], "public, max-age=60")
+
+    def test_precompressed_copy_is_picked_by_accept_encoding(self):
+        url = re.sub(r"styles\.\w+\.css", "", self.url) + "images/avatar_placeholder.svg"
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual((response["Content-Encoding"], response["Vary"]), ("gzip", "Accept-Encoding"))
+        self.assertEqual(gzip.decompress(response.content), open(os.path.join(settings.BASE_DIR, "auctions/static/auctions/images/avatar_placeholder.svg"), "rb").read())
+        self.assertFalse(self.client.get(url, HTTP_ACCEPT_ENCODING="gzip;q=0").has_header("Content-Encoding"))
+
+
+@override_settings(AUCTIONS_RATE_LIMITS={"bid": (2, 60), "comment": (2, 60), "watch": (1, 10)})
+class RateLimitTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create(username='seller')
+        self.bidder = User.objects.create(username='bidder')
+        self.category = Category.objects.create(name="Test Category")
+        self.listing = Listing.objects.create(title="Listing", description="Description", value=Decimal('1.00'), user=self.seller, category=self.category)
+        self.url = reverse("auctions:listing", args=(self.listing.id,))
+        self.client.force_login(self.bidder)
+
+    # at the start of a window for every limit
+    @mock.patch("auctions.ratelimit.time.time", return_value=1020.0)
+    def test_bids_over_the_limit_are_rejected_before_any_query(self, _):
+        for price in ("2.00", "3.00"):
+            self.assertEqual(self.client.post(self.url, {"submit_bid": "", "bid": price}).status_code, 302)
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, {"submit_bid": "", "bid": "4.00"})
+        # the full window still weighs half in the next one
+        self.assertEqual((response.status_code, response["Retry-After"]), (429, "90"))
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).bid_count, 2)
+        # comments have their own limit, other users their own
+        self.assertEqual(self.client.post(self.url, {"submit_comment": "", "comment": "Nice"}).status_code, 302)
+        self.client.force_login(self.seller)
+        self.assertEqual(self.client.post(self.url, {"submit_bid": "", "bid": "4.00"}).status_code, 302)
+
+    @mock.patch("auctions.ratelimit.time.time", return_value=1020.0)
+    def test_watch_toggle_gets_a_json_error(self, _):
+        url = reverse("auctions:watchlist_listing", args=(self.listing.id,))
+        self.assertTrue(self.client.post(url).json()["success"])
+        response = self.client.post(url)
+        self.assertEqual((response.status_code, response["Retry-After"], response.json()["success"]), (429, "20", False))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_previous_window_slides_out(self):
+        request = RequestFactory().post(self.url, REMOTE_ADDR="10.0.0.1")
+        self.assertEqual([count_request(request, "bid", now=1020) for _ in range(3)], [0, 0, 90])
+        # the previous window still counts in full, then half
+        self.assertEqual(count_request(request, "bid", now=1080), 30)
+        self.assertEqual(count_request(request, "bid", now=1110), 0)
+        self.assertGreater(count_request(request, "bid", now=1110), 0)
+        # another address has its own count
+        self.assertEqual(count_request(RequestFactory().post(self.url, REMOTE_ADDR="10.0.0.2"), "bid", now=1110), 0)
+
+    def test_concurrent_requests_cannot_share_the_last_slot(self):
+        request = RequestFactory().post(self.url, REMOTE_ADDR="10.0.0.1")
+        barrier = threading.Barrier(20)
+        results = []
+
+        def client():
+            barrier.wait()
+            results.append(count_request(request, "bid", now=1020))
+        threads = [threading.Thread(target=client) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(0), 2)
@@ -1,19 +1,33 @@
+from django.conf import settings
 from django.urls import path
 
+from . import api
 from . import views
+from . import async_views
 
 
 app_name = "auctions"
 
+# the read-heavy pages can be served by their async versions (under ASGI)
+pages = async_views if settings.AUCTIONS_ASYNC_VIEWS else views
+
 urlpatterns = [
-    path("", views.index, name="index"),
-    path("<int:category_id>", views.index, name="index_with_category"),
+    path("", pages.index, name="index"),
+    path("<int:category_id>", pages.index, name="index_with_category"),
     path("login", views.login_view, name="login"),
     path("logout", views.logout_view, name="logout"),
     path("register", views.register, name="register"),
-    path("categories", views.categories, name="categories"),
-    path("listing/<int:listing_id>", views.listing, name="listing"),
-    path("watchlist", views.watchlist, name="watchlist"),
+    path("categories", pages.categories, name="categories"),
+    path("search", views.search, name="search"),
+    path("listing/<int:listing_id>", pages.listing, name="listing"),
+    path("listing/<int:listing_id>/events", views.listing_events, name="listing_events"),
+    path("listing/<int:listing_id>/comments", views.listing_comments, name="listing_comments"),
+    path("watchlist", pages.watchlist, name="watchlist"),
+    # read-only JSON API
+    path("api/listings", api.listings, name="api_listings"),
+    path("api/listings/<int:listing_id>", api.listing, name="api_listing"),
+    path("export/<str:kind>", views.export, name="export"),
+    path("stats/views", views.view_stats, name="view_stats"),
     path("add_listing", views.add_listing, name="add_listing"),
     # the path is only to be used to update the watchlist listing
     path("watchlist/<int:listing_id>", views.watch_listing, name="watchlist_listing"),
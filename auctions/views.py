@@ -1,53 +1,105 @@
+import asyncio
+
 from django.contrib.auth import authenticate, login, logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
-from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
-from django.shortcuts import render
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import Paginator
+from .caching import get_category, render_listing_cards
+from .exports import EXPORTS, FORMATS, export_lines, parse_filters
 from .forms import NewListingForm, NewCommentForm, NewBidForm
-from .models import User, Listing, Category, Watchlist, Comment, Bid
+from .instrumentation import view_counters
+from .live import hub
+from .models import ArchivedListing, User, Listing, Category, Watchlist, Comment
+from .pagination import COMMENTS_PAGE_SIZE, PAGE_SIZE, active_listing_count, get_cursor, keyset_page
+from .ratelimit import rate_limit
+from .search import search_listings
+from .services import BidError, close_listings, place_bid
+
+
+# seconds between keepalive messages on an idle event stream
+EVENTS_KEEPALIVE = 15
+
+
+# rate limit scope of a form posted to the listing page
+def listing_post_scope(request):
+    if "submit_bid" in request.POST:
+        return "bid"
+    if "submit_comment" in request.POST:
+        return "comment"
+    return None
 
 
 def index(request, category_id=None):
+    listings = Listing.objects.filter(active=True)
     if category_id:
         # load listings by category
-        listings = Listing.objects.filter(category_id=category_id, active=True)
-        category = Category.objects.get(id=category_id).name
-        return render(request, "auctions/index.html", {
-            "category": category,
-            "listings": listings
-        })
+        listings = listings.filter(category_id=category_id)
+        category = get_category(category_id).name
     else:
         # load all active listings (default view)
-        listings = Listing.objects.filter(active=True)
         category = 'All'
-        return render(request, "auctions/index.html", {
-            "category": category,
-            "listings": listings
-        })
+
+    # only one page of listings is loaded, the total comes from a cached count
+    cursor = get_cursor(request)
+    page, next_cursor = keyset_page(listings, after=cursor)
+    return render(request, "auctions/index.html", {
+        "category": category,
+        "listings": page,
+        "cards": render_listing_cards(page),
+        "total": active_listing_count(listings, category_id),
+        "next_cursor": next_cursor,
+        "is_first_page": cursor is None
+    })
+
+
+def search(request):
+    text = request.GET.get("q", "")
+    try:
+        category_id = int(request.GET["category"])
+    except (KeyError, ValueError):
+        category_id = None
+    # only open listings unless asked otherwise
+    status = request.GET.get("status", "active")
+    active = {"active": True, "closed": False}.get(status)
+
+    results = search_listings(text, category_id=category_id, active=active)
+    page = Paginator(results, PAGE_SIZE).get_page(request.GET.get("page"))
+    return render(request, "auctions/search.html", {
+        "q": text,
+        "category_id": category_id,
+        "status": status,
+        "page": page,
+        "cards": render_listing_cards(list(page))
+    })
 
 
 def categories(request):
-    # load all categories
-    categories = Category.objects.all()
+    # load all categories with their live stats, one query
+    categories = Category.objects.select_related("stats").order_by("id")
     return render(request, "auctions/categories.html", {
         "categories": categories
     })
 
 
+@rate_limit(listing_post_scope)
 def listing(request, listing_id):
-    # load listing by id and all comments
-    listing = Listing.objects.get(pk=listing_id)
-    comments = listing.listing_comments.all()
+    # load listing by id and the newest page of comments, older ones are loaded by listing_comments
+    try:
+        listing = Listing.objects.get(pk=listing_id)
+    except Listing.DoesNotExist:
+        return archived_listing(request, listing_id)
+    comments, comments_cursor = keyset_page(listing.listing_comments.select_related("user"), size=COMMENTS_PAGE_SIZE)
     # check if user is watching the listing
     watching = Watchlist.objects.filter(user=request.user.id, listing=listing_id)
-    # we get the highest bid for this listing
-    bids = listing.listing_bids.all()
-    highest_bid = None
-    if bids.exists():
-        highest_bid = max(b.value for b in bids)
+    # the highest bid is stored on the listing
+    highest_bid = listing.current_price
 
     # POST request
     if request.method == "POST":
@@ -75,39 +127,13 @@ def listing(request, listing_id):
             bidForm = NewBidForm(request.POST)
             commentForm = NewCommentForm()
             if bidForm.is_valid():
-                # get all bids for this listing
-                bids = listing.listing_bids.all()
-                # get bid value from form
-                bid = bidForm.cleaned_data["bid"]
-                # create new bid
-                newBid = Bid(value=bid, user=request.user, listing=listing)
-
                 try:
-                    # apply model validation
-                    newBid.full_clean()
-
-                    ## BID REQUIREMENTS:
-
-                    # 1. bid must be the same or higher than listing value
-                    if bid < listing.value:
-                        raise Exception("Bid can not be lower than item value")
-                    
-                    # 2. bid must be higher than current highest bid
-                    if bids.exists():
-                        # uses a generator expression to get the highest bid value
-                        highest_bid = max(b.value for b in bids)
-                        if bid <= highest_bid:
-                            raise Exception("Bid must be higher than current highest bid")
-                
-                except ValidationError as e:
-                    # return bidForm to user with error
-                    bidForm.add_error("bid", "Bid must be the same or higher than current value")
-                except Exception as e:
+                    # validate and store the bid, safe against concurrent bidders
+                    place_bid(listing.id, request.user, bidForm.cleaned_data["bid"])
+                except BidError as e:
                     # return bidForm to user with error
-                    bidForm.add_error("bid", e)
+                    bidForm.add_error("bid", str(e))
                 else:
-                    # all in order so lets save the bid
-                    newBid.save()
                     return HttpResponseRedirect(reverse("auctions:listing", args=(listing.id,)))
     else:
         # create new comment and bid form
@@ -117,23 +143,113 @@ def listing(request, listing_id):
     return render(request, "auctions/listing.html", {
         "listing": listing,
         "comments": comments,
+        "comments_cursor": comments_cursor,
         "watching": True if watching.exists() else False,
         "commentForm": commentForm,
         "bidForm": bidForm,
-        "highest_bid": highest_bid
+        "highest_bid": highest_bid,
+        "live_events": live_events(request)
+    })
+
+
+# old closed listings are moved to the archive, they are shown read-only
+def archived_listing(request, listing_id):
+    listing = get_object_or_404(ArchivedListing.objects.select_related("user", "category", "winner"), pk=listing_id)
+    return render(request, "auctions/listing.html", {
+        "listing": listing,
+        "archived": True,
+        "highest_bid": listing.current_price
+    })
+
+
+# event streams are only served by the ASGI application (commerce/asgi.py), under
+# WSGI Django buffers an async stream to the end, which never comes
+def live_events(request):
+    return isinstance(request, ASGIRequest)
+
+
+# Server-Sent Events stream of new high bids and the close of a listing. Under
+# ASGI an open stream is just a waiting coroutine instead of a blocked worker
+# thread, under WSGI a 204 tells the browser not to reconnect
+async def listing_events(request, listing_id):
+    if not live_events(request):
+        return HttpResponse(status=204)
+    subscription = hub.subscribe(listing_id)
+
+    async def stream():
+        try:
+            # ask the browser to reconnect quickly if the stream drops
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # comment line so proxies do not close an idle stream
+                    yield ": keepalive\n\n"
+        finally:
+            hub.unsubscribe(listing_id, subscription)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# older comments of a listing as JSON, one page at a time. archived listings keep
+# their comments in the archive row, their page shows no comments to page through
+def listing_comments(request, listing_id):
+    listing = get_object_or_404(Listing.objects.only("id", "user_id"), pk=listing_id)
+    comments, next_cursor = keyset_page(listing.listing_comments.select_related("user"), after=get_cursor(request), size=COMMENTS_PAGE_SIZE)
+    return JsonResponse({
+        "comments": [{
+            "id": comment.id,
+            "user": comment.user.username,
+            "author": comment.user_id == listing.user_id,
+            "comment": comment.comment
+        } for comment in comments],
+        "next": next_cursor
     })
 
 
 @login_required(login_url='/login')
 def watchlist(request):
-    # load watchlist items by user id
-    user = User.objects.get(pk=request.user.id)
-    watchlist = user.watchlist.all()
+    # load one page of watchlist items together with their listings, most recently watched first
+    watchlist = Watchlist.objects.filter(user=request.user).select_related("listing")
+    cursor = get_cursor(request)
+    page, next_cursor = keyset_page(watchlist, after=cursor)
+    listings = [item.listing for item in page]
     return render(request, "auctions/watchlist.html", {
-        "watchlist": watchlist
+        "cards": render_listing_cards(listings),
+        # listing ids the user is the highest bidder on
+        "winning": {listing.id for listing in listings if listing.high_bidder_id == request.user.id},
+        "next_cursor": next_cursor,
+        "is_first_page": cursor is None
     })
 
 
+# listings, bids or watchlists as a CSV or JSONL download, streamed row by row so
+# memory stays flat however many rows match. filtered by ?since=&until=&category=&active=
+@staff_member_required
+def export(request, kind):
+    file_format = request.GET.get("format", "csv")
+    if kind not in EXPORTS or file_format not in FORMATS:
+        raise Http404
+    try:
+        filters = parse_filters(*(request.GET.get(name) for name in ("since", "until", "category", "active")))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(export_lines(kind, filters, file_format), content_type=FORMATS[file_format])
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{file_format}"'
+    return response
+
+
+# request counters per view since the worker started, to watch for regressions
+@staff_member_required
+def view_stats(request):
+    return JsonResponse({"views": view_counters.snapshot()})
+
+
 @login_required(login_url='/login')
 def add_listing(request):
     # POST request
@@ -147,9 +263,10 @@ def add_listing(request):
             starting_bid = form.cleaned_data["starting_bid"]
             image_url = form.cleaned_data["image_url"]
             category = form.cleaned_data["category"]
+            ends_at = form.cleaned_data["ends_at"]
 
             # create new listing
-            listing = Listing(title=title, description=description, value=starting_bid, image=image_url, category=category, user=request.user)
+            listing = Listing(title=title, description=description, value=starting_bid, image=image_url, category=category, user=request.user, ends_at=ends_at)
             
             try:
                 # apply model validation
@@ -174,17 +291,27 @@ def add_listing(request):
 
 # post required to aceess this view
 @require_POST
+@rate_limit("watch", json=True)
 def watch_listing(request, listing_id):
-    user_watching = Watchlist.objects.filter(user=request.user.id, listing=listing_id)
     response = { 'success': False, 'message': 'The Database could not be updated' }
-    if user_watching:
-        user_watching.delete()
+    # a single DELETE tells whether the user was watching the listing
+    removed, _ = Watchlist.objects.filter(user=request.user.id, listing=listing_id).delete()
+    if removed:
         response['success'] = True
         response['type'] = 'REMOVE'
         response['message'] = 'Listing removed from watchlist'
     else:
-        watching = Watchlist(user=User.objects.get(pk=request.user.id), listing=Listing.objects.get(pk=listing_id))
-        watching.save()
+        # request.user is the logged in user already, no need to load it or the listing again
+        watching = Watchlist(user=request.user, listing_id=listing_id)
+        try:
+            # a savepoint, so a failed insert leaves any surrounding transaction usable
+            with transaction.atomic():
+                watching.save()
+        except IntegrityError:
+            # a concurrent request of the same user added it first, anything else
+            # (a listing that does not exist) is still an error
+            if not Watchlist.objects.filter(user=request.user.id, listing=listing_id).exists():
+                raise
         response['success'] = True
         response['type'] = 'ADD'
         response['message'] = 'Listing added to watchlist'
@@ -199,23 +326,8 @@ def close_listing(request):
         listing_id = request.POST["listing_to_close"]
         # get the listing object using the id
         listing = Listing.objects.get(pk=listing_id)
-        # get the highest bid for this listing
-        bids = listing.listing_bids.all()
-        # check if there are any bids
-        if bids.exists():
-            # get the highest bid value
-            highest_bid = max(b.value for b in bids)
-            # get the highest bid object
-            highest_bid_obj = bids.get(value=highest_bid)
-            # set the listing winner to the highest bid user
-            listing.winner = highest_bid_obj.user
-            # close the listing
-            listing.active = False
-            listing.save()
-        else:
-            # no bids so just close the listing
-            listing.active = False
-            listing.save()
+        # close the listing, the highest bidder (if any) wins it
+        close_listings([listing])
 
         return HttpResponseRedirect(reverse("auctions:listing", args=(listing.id,)))
 
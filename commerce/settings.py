@@ -44,7 +44,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # outermost, so it times everything below it
+    'auctions.middleware.RequestTimingMiddleware',
+    'auctions.middleware.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # answers static file requests before sessions and auth are loaded
+    'auctions.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -57,7 +62,8 @@ ROOT_URLCONF = 'commerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # the Django backend with render time measured for RequestTimingMiddleware
+        'BACKEND': 'auctions.instrumentation.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'auctions/templates/auctions')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -80,12 +86,113 @@ WSGI_APPLICATION = 'commerce.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': os.environ.get('AUCTIONS_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
     }
 }
 
+# PRAGMAs run on every new SQLite connection (see auctions/database.py)
+
+AUCTIONS_SQLITE_PRAGMAS = {}
+
+# Production database profile (AUCTIONS_DB_PROFILE=production): connections are
+# kept open between requests (and checked before reuse), writes take the lock when
+# their transaction begins instead of failing on a lock upgrade, and SQLite runs in
+# WAL mode so readers never block the writer
+
+AUCTIONS_DB_PROFILE = os.environ.get('AUCTIONS_DB_PROFILE', 'development')
+
+if AUCTIONS_DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            # seconds to wait for the write lock, the busy_timeout PRAGMA below sets the same
+            'timeout': 5,
+        },
+    })
+    AUCTIONS_SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        # ms to wait for a lock before raising "database is locked"
+        'busy_timeout': 5000,
+        # with WAL only a checkpoint syncs, a power loss may lose the last commits but never corrupts
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        # negative is in KiB, 64 MiB of page cache per connection
+        'cache_size': -64 * 1024,
+        'temp_store': 'MEMORY',
+    }
+
+# Read replicas: AUCTIONS_DB_REPLICAS is a comma separated list of database files
+# kept as copies of the primary (default) database. Reads are spread over them,
+# writes go to the primary (see auctions/routers.py). After a user writes, their
+# reads stay on the primary for AUCTIONS_PRIMARY_STICKY_SECONDS (the replica lag)
+
+AUCTIONS_READ_REPLICAS = []
+
+for number, name in enumerate(filter(None, os.environ.get('AUCTIONS_DB_REPLICAS', '').split(',')), start=1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': name, 'TEST': {'MIRROR': 'default'}}
+    AUCTIONS_READ_REPLICAS.append(alias)
+
+AUCTIONS_PRIMARY_STICKY_SECONDS = int(os.environ.get('AUCTIONS_PRIMARY_STICKY_SECONDS', 5))
+
+DATABASE_ROUTERS = ['auctions.routers.PrimaryReplicaRouter']
+
 AUTH_USER_MODEL = 'auctions.User'
 
+# Serve index, categories, listing (GET) and watchlist with their async views,
+# only useful when running under ASGI (commerce/asgi.py)
+
+AUCTIONS_ASYNC_VIEWS = os.environ.get('AUCTIONS_ASYNC_VIEWS') == '1'
+
+# Requests over any of these are logged by RequestTimingMiddleware
+# (logger auctions.performance): total time in ms, number of SQL queries, and
+# the same query repeated this many times (an N+1 pattern)
+
+AUCTIONS_SLOW_REQUEST_MS = int(os.environ.get('AUCTIONS_SLOW_REQUEST_MS', 500))
+AUCTIONS_SLOW_QUERY_COUNT = int(os.environ.get('AUCTIONS_SLOW_QUERY_COUNT', 30))
+AUCTIONS_SLOW_DUPLICATE_QUERIES = int(os.environ.get('AUCTIONS_SLOW_DUPLICATE_QUERIES', 5))
+
+# Closed listings older than this are moved to the archive tables by
+# manage.py archive_listings
+
+AUCTIONS_ARCHIVE_AFTER_DAYS = int(os.environ.get('AUCTIONS_ARCHIVE_AFTER_DAYS', 90))
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Per-process memory cache, point this at a shared backend (e.g. Redis or
+# Memcached) when running more than one worker
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Sessions and the logged in user
+# Sessions are read from the cache and written through to the database, the
+# user of each request comes from a cached copy (see auctions.auth)
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+AUTHENTICATION_BACKENDS = ['auctions.auth.CachedModelBackend']
+
+AUCTIONS_USER_CACHE_SECONDS = int(os.environ.get('AUCTIONS_USER_CACHE_SECONDS', 300))
+
+# Rate limits of the views that write: scope -> (requests, seconds), a client can
+# send `requests` in any `seconds`. Counted with atomic sliding window counters
+# instead of token buckets, which the cache API cannot update atomically (see
+# auctions.ratelimit). The counters are kept in this cache
+
+AUCTIONS_RATE_LIMITS = {
+    'bid': (10, 10),
+    'comment': (5, 60),
+    'watch': (30, 60),
+}
+
+AUCTIONS_RATE_LIMIT_CACHE = os.environ.get('AUCTIONS_RATE_LIMIT_CACHE', 'default')
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -123,3 +230,18 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# manage.py collectstatic copies the files here with a content hash in their
+# names plus gzip and brotli copies (brotli needs the brotli package), the app
+# serves them itself (auctions.middleware.StaticFilesMiddleware) when DEBUG is off
+
+STATIC_ROOT = os.environ.get('AUCTIONS_STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles'))
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'auctions.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}